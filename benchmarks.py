@@ -0,0 +1,607 @@
+# Benchmarks for hot paths of server.py
+# Every benchmark runs against throwaway SQLite database (never instance/workout.db),
+# seeded with exercises from "Excercise Database" and one user with a plan.
+#
+#   python benchmarks.py catalog
+#   python benchmarks.py suggest
+#   python benchmarks.py search
+#   python benchmarks.py ingest --rows 12000
+#   python benchmarks.py explain --sessions 3000
+#   python benchmarks.py concurrency --writers 2 --readers 2 --sessions 1000
+#   python benchmarks.py training_session    (exits with 1 when statement budget is exceeded)
+#   python benchmarks.py set_logging --sets 200
+#   python benchmarks.py plan_editor --days 6 --exercises 8
+#   python benchmarks.py mesocycle_clone --days 7 --exercises 40
+import argparse
+import glob
+import os
+import re
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+BENCH_DIR = tempfile.mkdtemp(prefix="workout_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(BENCH_DIR, 'bench.db')}"
+
+from flask_login import login_user
+from sqlalchemy import event, insert, text
+from sqlalchemy.exc import OperationalError
+from werkzeug.security import generate_password_hash
+
+import server
+from server import (
+    Exercise,
+    ExerciseEntries,
+    Mesocycles,
+    Sessions,
+    Users,
+    WorkoutExercises,
+    WorkoutPlan,
+    app,
+    db,
+)
+
+EXERCISE_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Excercise Database")
+
+
+@contextmanager
+def count_statements():
+    counter = {"statements": 0}
+
+    def before_cursor_execute(*args):
+        counter["statements"] += 1
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+@contextmanager
+def count_calls(function_name):
+    # Count how many times helper from server.py is called (helpers call each other by global name)
+    counter = {"calls": 0}
+    original = getattr(server, function_name)
+
+    def wrapper(*args, **kwargs):
+        counter["calls"] += 1
+        return original(*args, **kwargs)
+
+    setattr(server, function_name, wrapper)
+    try:
+        yield counter
+    finally:
+        setattr(server, function_name, original)
+
+
+def outside_app_context(function):
+    # Test client requests made inside our app context reuse it, so they would share flask.g
+    # (logged in user, request user context). Thread starts without one -> every request
+    # gets its own context like in production
+    def run(*args, **kwargs):
+        result = []
+        thread = threading.Thread(target=lambda: result.append(function(*args, **kwargs)))
+        thread.start()
+        thread.join()
+        return result[0]
+    return run
+
+
+def timed(function, repeat=200):
+    # Median run time in milliseconds
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        runs.append((time.perf_counter() - start) * 1000)
+    return statistics.median(runs)
+
+
+def seed_exercises():
+    names = set()
+    for path in sorted(glob.glob(os.path.join(EXERCISE_FILES, "*_exercises.txt"))):
+        muscle_group = os.path.basename(path).removesuffix("_exercises.txt")
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                name = " ".join(line.split())
+                if name and name not in names:
+                    names.add(name)
+                    db.session.add(Exercise(name, muscle_group))
+    db.session.commit()
+
+
+def seed_user_plan(days=6, exercises_per_day=8, username="bench"):
+    user = Users(username=username, password=generate_password_hash("bench"), age=30, weight=80, email=f"{username}@example.com")
+    db.session.add(user)
+    db.session.commit()
+
+    mesocycle = Mesocycles(user.user_id, 4, days, "Bench mesocycle")
+    db.session.add(mesocycle)
+    db.session.commit()
+
+    exercise_ids = [row[0] for row in db.session.query(Exercise.exercise_id).limit(days * exercises_per_day)]
+    for day in range(days):
+        workout = WorkoutPlan(user.user_id, f"Day {day + 1}", mesocycle.mesocycle_id)
+        db.session.add(workout)
+        db.session.flush()
+        for order in range(exercises_per_day):
+            db.session.add(WorkoutExercises(
+                workout.workout_id,
+                exercise_ids[day * exercises_per_day + order],
+                order + 1,
+                3,
+                120,
+            ))
+    db.session.commit()
+    return user
+
+
+def seed_history(user, sessions=3000, sets_per_exercise=3):
+    # Past sessions of user's plan, oldest first, one per day
+    plan = (
+        db.session.query(WorkoutPlan.workout_id, WorkoutExercises.exercise_id)
+        .join(WorkoutExercises, WorkoutExercises.workout_id == WorkoutPlan.workout_id)
+        .filter(WorkoutPlan.user_id == user.user_id)
+        .order_by(WorkoutPlan.workout_id)
+        .all()
+    )
+    workouts = {}
+    for workout_id, exercise_id in plan:
+        workouts.setdefault(workout_id, []).append(exercise_id)
+    workout_ids = list(workouts)
+
+    first_day = datetime.now() - timedelta(days=sessions + 1)
+    db.session.execute(insert(Sessions), [
+        {
+            "user_id": user.user_id,
+            "workout_id": workout_ids[i % len(workout_ids)],
+            "session_date": first_day + timedelta(days=i),
+            "training_day": (first_day + timedelta(days=i)).date(),
+            "notes": "Null",
+        }
+        for i in range(sessions)
+    ])
+    session_rows = db.session.query(Sessions.session_id, Sessions.workout_id).filter(Sessions.user_id == user.user_id).all()
+    db.session.execute(insert(ExerciseEntries), [
+        {
+            "session_id": session_id,
+            "exercise_id": exercise_id,
+            "set_number": set_number,
+            "reps": 8,
+            "weight": 50.0 + session_id % 20,
+            "rpe": 8,
+            "notes": "",
+        }
+        for session_id, workout_id in session_rows
+        for exercise_id in workouts[workout_id]
+        for set_number in range(1, sets_per_exercise + 1)
+    ])
+    db.session.commit()
+    return len(session_rows)
+
+
+def setup_database(days=6, exercises_per_day=8):
+    server.init_db()
+    seed_exercises()
+    return seed_user_plan(days, exercises_per_day)
+
+
+# Benchmarks -------------------------------------------------------------------------------
+def catalog_benchmark(args):
+    user = setup_database(args.days, args.exercises)
+
+    with app.test_request_context():
+        login_user(user)
+        mesocycle_info = server.show_tables_to_user(user.user_id)
+        mesocycle_name = next(iter(mesocycle_info[0]))
+
+        def render():
+            server.tables_informations(mesocycle_name, mesocycle_info)
+            server.workout_day_information(mesocycle_name, mesocycle_info)
+
+        server.invalidate_exercise_catalog()
+        with count_statements() as cold, count_calls("find_exercise_name_db") as lookups:
+            render()
+        with count_statements() as warm:
+            render()
+
+        print(f"Plan: {args.days} days x {args.exercises} exercises, catalog {len(server.get_exercise_catalog()['by_id'])} rows")
+        print(f"Exercise name lookups per render:        {lookups['calls']}")
+        print(f"Statements per render before (1/lookup): {warm['statements'] + lookups['calls']}")
+        print(f"Statements per render, catalog cold:     {cold['statements']}")
+        print(f"Statements per render, catalog warm:     {warm['statements']}")
+
+        exercise_ids = list(server.get_exercise_catalog()["by_id"])[: args.days * args.exercises]
+        query_ms = timed(lambda: [
+            db.session.query(Exercise.exercise_name).filter(Exercise.exercise_id == exercise_id).first()
+            for exercise_id in exercise_ids
+        ], repeat=20)
+        catalog_ms = timed(lambda: [server.find_exercise_name_db(exercise_id) for exercise_id in exercise_ids])
+        print(f"{len(exercise_ids)} lookups via SELECT:  {query_ms:.3f} ms")
+        print(f"{len(exercise_ids)} lookups via catalog: {catalog_ms:.3f} ms")
+
+
+def suggest_benchmark(args):
+    setup_database(args.days, args.exercises)
+    server.get_exercise_suggest_index()
+
+    print(f"Catalog {len(server.get_exercise_catalog()['by_id'])} rows, top {app.config['SUGGESTIONS_LIMIT']} suggestions")
+    for term in ("b", "be", "ben", "bench", "bench press", "incline", "curl", "dumbbell row", "xyz"):
+        suggest_ms = timed(lambda: server.suggest_exercises(term), repeat=1000)
+        like_ms = timed(lambda: Exercise.query.filter(Exercise.exercise_name.ilike(f"%{term}%")).all(), repeat=50)
+        top = server.suggest_exercises(term)[:3]
+        print(f"{term!r:15} index {suggest_ms:.4f} ms   ILIKE scan {like_ms:.3f} ms   {top}")
+
+
+def search_benchmark(args):
+    setup_database(args.days, args.exercises)
+
+    for term, groups in (("incline dumbbell", None), ("press", ["chest"]), ("row", ["back"]), ("curl", None)):
+        search_ms = timed(lambda: server.search_exercises(term, groups), repeat=200)
+        like_ms = timed(lambda: Exercise.query.filter(Exercise.exercise_name.ilike(f"%{term}%")).all(), repeat=50)
+        found = server.search_exercises(term, groups)
+        top = [row["exercise"] for row in found["results"][:3]]
+        print(f"{term!r:20} {groups or ''!s:10} FTS {search_ms:.3f} ms   ILIKE {like_ms:.3f} ms   {top}")
+        print(f"{'':32} facets {found['facets']}")
+
+
+def ingest_benchmark(args):
+    server.init_db()
+
+    # Real files + generated ones, so the run is well over 10k rows
+    source = os.path.join(BENCH_DIR, "exercise_files")
+    os.makedirs(source)
+    for path in glob.glob(os.path.join(EXERCISE_FILES, "*_exercises.txt")):
+        with open(path, encoding="utf-8") as file, open(os.path.join(source, os.path.basename(path)), "w", encoding="utf-8") as copy:
+            copy.write(file.read())
+    per_file = args.rows // 10
+    for group in range(10):
+        with open(os.path.join(source, f"generated_{group}_exercises.txt"), "w", encoding="utf-8") as file:
+            file.writelines(f"Generated  Exercise {group}-{i}\n" for i in range(per_file))
+
+    runner = app.test_cli_runner()
+    for label in ("first run", "re-run (no-op)"):
+        result = runner.invoke(args=["import-exercises", "--source", source])
+        print(f"{label}:")
+        print(result.output)
+
+
+def explain_benchmark(args):
+    user = setup_database(args.days, args.exercises)
+    sessions = seed_history(user, args.sessions)
+    # Other athletes, so statistics (ANALYZE) look like multi user database
+    for other in range(args.other_users):
+        seed_history(seed_user_plan(args.days, args.exercises, f"athlete{other}"), args.sessions // 2)
+    db.session.execute(server.text("ANALYZE"))
+    day_name = "Day 1"
+    exercise_name = server.find_exercise_name_db(
+        db.session.query(WorkoutExercises.exercise_id).first()[0]
+    )[0]
+
+    app.config.update(WTF_CSRF_ENABLED=False)
+    client = app.test_client()
+    client.get = outside_app_context(client.get)
+    client.post = outside_app_context(client.post)
+    client.post("/login", data={"username": "bench", "password": "bench"})
+    client.get(f"/training_session?training_day={day_name}")
+
+    pages = {
+        "training_session": lambda: client.get(f"/training_session?chosen_exercise={exercise_name}"),
+        "progress": lambda: client.get("/progress"),
+        "statistics": lambda: client.post("/statistics", data={"chosen_exercise": exercise_name}),
+        "exercise_history": lambda: client.get(f"/exercise_history?exercise={exercise_name}&before=2000"),
+    }
+
+    print(f"{sessions} sessions of benchmarked user, {args.other_users} other users, "
+          f"{db.session.query(ExerciseEntries).count()} exercise entries in total\n")
+    for page, request_page in pages.items():
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, "before_cursor_execute", capture)
+        try:
+            request_page()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", capture)
+
+        # Same statement from a loop is explained once
+        distinct = {}
+        for statement, parameters in statements:
+            distinct.setdefault(statement, [parameters, 0])[1] += 1
+
+        print(f"== {page}: {len(statements)} queries, {len(distinct)} distinct")
+        with db.engine.connect() as connection:
+            for statement, (parameters, count) in distinct.items():
+                plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+                steps = [row[-1] for row in plan]
+                # SCAN of a real table (not subquery / CTE / covering index) is what we don't want
+                derived = tuple(f"SCAN {name}" for name in re.findall(r"(\w+) AS \(", statement))
+                scans = [step for step in steps if step.startswith("SCAN") and "INDEX" not in step
+                         and not step.startswith(("SCAN plan_days", "SCAN (subquery") + derived)]
+                verdict = "TABLE SCAN" if scans else "index"
+                print(f"  [{verdict:10}] x{count:<5} {' '.join(statement.split())[:150]}")
+                for step in steps if scans or args.verbose else []:
+                    print(f"      {step}")
+        print()
+
+
+# Statements one refresh of training_session may run: load_user, plan (cold plan cache)
+# and load_training_session_view
+TRAINING_SESSION_STATEMENT_BUDGET = 3
+
+
+def training_session_benchmark(args):
+    user = setup_database(args.days, args.exercises)
+    seed_history(user, args.sessions)
+    exercise_name = server.find_exercise_name_db(
+        db.session.query(WorkoutExercises.exercise_id).first()[0]
+    )[0]
+
+    app.config.update(WTF_CSRF_ENABLED=False)
+    client = app.test_client()
+    client.get = outside_app_context(client.get)
+    client.post = outside_app_context(client.post)
+    client.post("/login", data={"username": "bench", "password": "bench"})
+    client.get("/training_session?training_day=Day 1")
+
+    cases = {
+        "day chosen": lambda: client.get("/training_session?chosen_exercise="),
+        "exercise chosen": lambda: client.get(f"/training_session?chosen_exercise={exercise_name}"),
+        "after set saved": lambda: client.get("/training_session"),
+    }
+    print(f"{args.sessions} sessions of history, budget {TRAINING_SESSION_STATEMENT_BUDGET} statements per page\n")
+    over_budget = []
+    for case, request_page in cases.items():
+        if case == "after set saved":
+            client.post("/training_session", data={"confirm_button": "1", "reps": "8", "kg": "100", "rpe": "8"})
+
+        with server.plan_cache_lock:
+            server.plan_cache.clear()
+        with count_statements() as cold:
+            request_page()
+        with count_statements() as warm:
+            request_page()
+        ms = timed(request_page, repeat=50)
+
+        print(f"{case:18} cold plan cache {cold['statements']} statements, "
+              f"warm {warm['statements']} statements, {ms:.2f} ms")
+        if max(cold["statements"], warm["statements"]) > TRAINING_SESSION_STATEMENT_BUDGET:
+            over_budget.append(case)
+
+    if over_budget:
+        print(f"\nOver statement budget: {', '.join(over_budget)}")
+        raise SystemExit(1)
+
+
+def plan_editor_benchmark(args):
+    setup_database(args.days, args.exercises)
+    app.config.update(WTF_CSRF_ENABLED=False)
+    client = app.test_client()
+    client.get = outside_app_context(client.get)
+    client.post = outside_app_context(client.post)
+    client.post("/login", data={"username": "bench", "password": "bench"})
+
+    def edit_whole_plan(round_number):
+        # Every day renamed, every exercise gets new sets / rest, one new exercise per day
+        plan_version = db.session.get(Users, 1).plan_version
+        plan = server.plan_cache_get((1, plan_version))
+        new_exercises = db.session.query(Exercise.exercise_name).offset(args.days * args.exercises).limit(args.days).all()
+        # Version the form was rendered from, like the hidden field of create_workout.html
+        data = {"plan_version": plan_version}
+        for day, workout_id in enumerate(plan["workouts_id"]):
+            data[f"workout_name_{day}"] = f"Day {day + 1} v{round_number}"
+            data[f"new_exercise_{day}"] = new_exercises[day][0]
+            for idx, exercise in enumerate(plan["exercises"][workout_id]):
+                data[f"exercise_{day}_{idx}"] = exercise["exercise"][0]
+                data[f"sets_{day}_{idx}"] = str(3 + round_number % 2)
+                data[f"pauses_{day}_{idx}"] = str(90 + round_number)
+        return client.post("/create_workout", data=data)
+
+    client.get("/create_workout")
+    with count_statements() as counter:
+        start = time.perf_counter()
+        edit_whole_plan(1)
+        ms = (time.perf_counter() - start) * 1000
+    db.session.expire_all()
+    print(f"Plan {args.days} days x {args.exercises} exercises, whole plan edited in one POST")
+    print(f"Statements: {counter['statements']}, {ms:.2f} ms")
+
+
+def mesocycle_clone_benchmark(args):
+    setup_database(args.days, args.exercises)
+    app.config.update(WTF_CSRF_ENABLED=False)
+    client = app.test_client()
+    client.get = outside_app_context(client.get)
+    client.post = outside_app_context(client.post)
+    client.post("/login", data={"username": "bench", "password": "bench"})
+
+    def timed_post(url, data):
+        with count_statements() as counter:
+            start = time.perf_counter()
+            client.post(url, data=data)
+            ms = (time.perf_counter() - start) * 1000
+        return counter["statements"], ms
+
+    print(f"Plan {args.days} days x {args.exercises} exercises")
+    for label, url, data in (
+        ("clone mesocycle", "/table_layout", {"meso_name": "Next", "mesocycle": "4", "start_from": "mesocycle_1"}),
+        ("save as template", "/save_plan_template", {"template_name": "Bench template"}),
+        ("instantiate template", "/table_layout", {"meso_name": "From template", "mesocycle": "4", "start_from": "template_1"}),
+    ):
+        statements, ms = timed_post(url, data)
+        print(f"{label:22} statements {statements:3}  {ms:7.2f} ms")
+
+    db.session.expire_all()
+    copied = db.session.query(WorkoutExercises).count()
+    expected = args.days * args.exercises * 4  # source, clone, template, mesocycle from template
+    print(f"Plan exercises in database: {copied} (expected {expected})")
+
+
+def set_logging_benchmark(args):
+    user = setup_database(args.days, args.exercises)
+    seed_history(user, args.sessions)
+    exercise_name = server.find_exercise_name_db(
+        db.session.query(WorkoutExercises.exercise_id).first()[0]
+    )[0]
+
+    app.config.update(WTF_CSRF_ENABLED=False)
+    client = app.test_client()
+    client.get = outside_app_context(client.get)
+    client.post = outside_app_context(client.post)
+    client.post("/login", data={"username": "bench", "password": "bench"})
+    client.get("/training_session?training_day=Day 1")
+    client.get(f"/training_session?chosen_exercise={exercise_name}")
+    # First set creates today's session, API logs into it
+    client.post("/training_session", data={"confirm_button": "1", "reps": "8", "kg": "100", "rpe": "8"})
+    session_id = db.session.query(db.func.max(Sessions.session_id)).scalar()
+
+    flows = {
+        "form POST (full page)": lambda: client.post(
+            "/training_session", data={"confirm_button": "1", "reps": "8", "kg": "100", "rpe": "8"}
+        ),
+        "JSON API POST": lambda: client.post(
+            f"/api/sessions/{session_id}/sets",
+            json={"exercise": exercise_name, "reps": 8, "weight": 100, "rpe": 8},
+        ),
+    }
+    print(f"{args.sessions} sessions of history, {args.sets} sets logged per flow\n")
+    for flow, log_set in flows.items():
+        latency, size = [], 0
+        for _ in range(args.sets):
+            start = time.perf_counter()
+            response = log_set()
+            latency.append((time.perf_counter() - start) * 1000)
+            size = len(response.data)
+        latency.sort()
+        print(f"{flow:22} p50 {statistics.median(latency):6.2f} ms  "
+              f"p95 {latency[int(len(latency) * 0.95)]:6.2f} ms  {size:6} bytes per set")
+
+
+# SQLite as it was before SQLITE_PRAGMAS (rollback journal, full fsync)
+BASELINE_SQLITE_PRAGMAS = {"journal_mode": "DELETE", "synchronous": "FULL"}
+
+
+def read_write_burst(engine, user_id, args):
+    # Writers log sets in bursts (session + 12 sets per transaction), readers run statistics query
+    read_latency = []
+    errors = {"read": 0, "write": 0}
+    statistics_query = text("""
+        SELECT e.exercise_id, max(e.weight), max(e.reps)
+        FROM exercise_entries e
+        JOIN sessions s ON s.session_id = e.session_id
+        WHERE s.user_id = :user_id
+        GROUP BY e.exercise_id
+    """)
+
+    def writer():
+        # Same write load in both runs: fixed rate of bursts for fixed time
+        interval = args.writers / args.rate
+        next_burst = time.perf_counter()
+        while time.perf_counter() < deadline:
+            try:
+                with engine.begin() as connection:
+                    session_id = connection.execute(
+                        insert(Sessions).values(user_id=user_id, workout_id=1, notes="Null")
+                    ).inserted_primary_key[0]
+                    connection.execute(insert(ExerciseEntries), [
+                        {"session_id": session_id, "exercise_id": 1, "set_number": i, "reps": 8,
+                         "weight": 60.0, "rpe": 8, "notes": ""}
+                        for i in range(12)
+                    ])
+                bursts.append(1)
+            except OperationalError:
+                errors["write"] += 1
+            next_burst += interval
+            time.sleep(max(0.0, next_burst - time.perf_counter()))
+
+    def reader():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                with engine.connect() as connection:
+                    connection.execute(statistics_query, {"user_id": user_id}).all()
+                read_latency.append((time.perf_counter() - start) * 1000)
+            except OperationalError:
+                errors["read"] += 1
+
+    bursts = []
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=writer) for _ in range(args.writers)]
+    threads += [threading.Thread(target=reader) for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    read_latency.sort()
+    return {
+        "reads": len(read_latency),
+        "p50": statistics.median(read_latency) if read_latency else 0,
+        "p95": read_latency[int(len(read_latency) * 0.95)] if read_latency else 0,
+        "max": read_latency[-1] if read_latency else 0,
+        "write_bursts_per_s": len(bursts) / args.seconds,
+        "errors": errors,
+    }
+
+
+def concurrency_benchmark(args):
+    user = setup_database(args.days, args.exercises)
+    seed_history(user, args.sessions)
+    tuned = dict(app.config["SQLITE_PRAGMAS"])
+
+    print(f"{args.writers} writers ({args.rate} bursts/s in total), {args.readers} readers, "
+          f"{args.seconds} s per run, {args.sessions} sessions of history")
+    for label, pragmas in (("before (rollback journal)", BASELINE_SQLITE_PRAGMAS), ("after (SQLITE_PRAGMAS)", tuned)):
+        app.config["SQLITE_PRAGMAS"] = pragmas
+        db.engine.dispose()  # new connections -> new pragmas
+        result = read_write_burst(db.engine, user.user_id, args)
+        print(f"{label:26} reads {result['reads']:5}  p50 {result['p50']:7.2f} ms  p95 {result['p95']:7.2f} ms  "
+              f"max {result['max']:7.2f} ms  writes {result['write_bursts_per_s']:6.1f} bursts/s  errors {result['errors']}")
+
+    app.config["SQLITE_PRAGMAS"] = tuned
+    db.engine.dispose()
+
+
+BENCHMARKS = {
+    "catalog": catalog_benchmark,
+    "concurrency": concurrency_benchmark,
+    "explain": explain_benchmark,
+    "ingest": ingest_benchmark,
+    "mesocycle_clone": mesocycle_clone_benchmark,
+    "plan_editor": plan_editor_benchmark,
+    "search": search_benchmark,
+    "set_logging": set_logging_benchmark,
+    "suggest": suggest_benchmark,
+    "training_session": training_session_benchmark,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for Workout Diary hot paths")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--days", type=int, default=6, help="workout days in seeded plan")
+    parser.add_argument("--exercises", type=int, default=8, help="exercises per day in seeded plan")
+    parser.add_argument("--sessions", type=int, default=3000, help="past sessions seeded for explain benchmark")
+    parser.add_argument("--other-users", type=int, default=5, help="other users seeded for explain benchmark")
+    parser.add_argument("--writers", type=int, default=2, help="writer threads for concurrency benchmark")
+    parser.add_argument("--readers", type=int, default=2, help="reader threads for concurrency benchmark")
+    parser.add_argument("--rate", type=float, default=40, help="write bursts per second for concurrency benchmark")
+    parser.add_argument("--seconds", type=float, default=5, help="duration of each concurrency run")
+    parser.add_argument("--verbose", action="store_true", help="print every query plan step")
+    parser.add_argument("--rows", type=int, default=12000, help="generated rows for ingest benchmark")
+    parser.add_argument("--sets", type=int, default=200, help="sets logged per flow in set_logging benchmark")
+    args = parser.parse_args()
+
+    with app.app_context():
+        BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
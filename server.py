@@ -1,23 +1,39 @@
 import os
+import re
+import sqlite3
+import glob
+import time
+import click
+import enum
+import unicodedata
+import bisect
+import heapq
+import threading
 import inspect # Example: print(f"Exception line {inspect.currentframe().f_lineno}: {e}")
 import pandas as pd
 import io
 import matplotlib.dates
 import base64
+import uuid
 
 from matplotlib.figure import Figure
 from io import BytesIO
-from datetime import datetime, date, timedelta
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
 from flask import (
     Flask,
     flash,
+    g,
     jsonify,
     redirect,
     render_template,
     request,
     session,
     url_for,
-    send_file
+    send_file,
+    has_request_context,
 )
 from flask_login import (
     LoginManager,
@@ -32,19 +48,26 @@ from flask_wtf import FlaskForm
 from sqlalchemy import (
     Column,
     Float,
+    bindparam,
+    text,
     Integer,
-    MetaData,
     String,
     DateTime,
+    Date,
+    Enum,
     and_,
+    case,
     func,
-    create_engine,
     select,
     desc,
     delete,
-
+    insert,
+    update,
+    event,
 )
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import DeclarativeBase, Session
 from werkzeug.security import check_password_hash, generate_password_hash
 from wtforms import FloatField, IntegerField, PasswordField, StringField, SubmitField
 from wtforms.validators import DataRequired, EqualTo, NumberRange
@@ -63,21 +86,42 @@ class Base(DeclarativeBase):
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-app.config["SQLALCHEMY_DATABASE_URI"] = (
-    f"sqlite:///{os.path.join(basedir, 'instance/workout.db')}"
+app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+    "DATABASE_URL", f"sqlite:///{os.path.join(basedir, 'instance/workout.db')}"
 )
 
 # app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///workout.db"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(hours=20)
-
-# Create engine so I can work with dynamic tables
-engine = create_engine(app.config["SQLALCHEMY_DATABASE_URI"])
-metadata = MetaData()
+# How many assembled plans (user, plan version) are kept in memory
+app.config["PLAN_CACHE_SIZE"] = 256
+# Autocomplete - default and max number of suggestions returned
+app.config["SUGGESTIONS_LIMIT"] = 10
+app.config["SUGGESTIONS_MAX_LIMIT"] = 25
+
+# SQLite pragmas applied to every new connection of the pool
+app.config["SQLITE_PRAGMAS"] = {
+    "journal_mode": "WAL",      # readers and writer don't block each other
+    "synchronous": "NORMAL",    # safe with WAL, fsync only at checkpoint
+    "busy_timeout": 5000,       # ms to wait for lock before "database is locked"
+    "cache_size": -20000,       # negative = KiB -> 20 MB page cache per connection
+    "mmap_size": 268435456,     # 256 MB of database read through memory map
+    "temp_store": "MEMORY",     # temp b-trees (ORDER BY, GROUP BY) in memory
+    "foreign_keys": "ON",       # workout_id / session_id ... must point at existing rows
+}
 
 db = SQLAlchemy(model_class=Base)
 db.init_app(app)
 
+@event.listens_for(Engine, "connect")
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma, value in app.config["SQLITE_PRAGMAS"].items():
+        cursor.execute(f"PRAGMA {pragma} = {value}")
+    cursor.close()
+
 # 1. Users Table
 class Users(UserMixin, db.Model):
     __tablename__ = "users"
@@ -88,6 +132,10 @@ class Users(UserMixin, db.Model):
     weight = Column(Float, unique=False, nullable=False)
     mesocycles = Column(Integer, unique=False, nullable=True)
     email = Column(String(100), unique=True, nullable=False)
+    # Bumped on every change of mesocycle / workouts / workout_exercises -> plan cache key
+    plan_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # IANA name, decides where user's training day starts and ends
+    timezone = Column(String(64), nullable=False, default="UTC", server_default="UTC")
 
     def __repr__(self):
         return f"<User {self.username}>"
@@ -111,35 +159,64 @@ class Exercise(UserMixin, db.Model):
     def __init__(self, exercise, muscle_group):
         self.exercise_name = exercise
         self.muscle_group = muscle_group
+# Planned day of mesocycle, one-day custom workout (intuitive training page) or legacy intuitive day
+class WorkoutKind(enum.Enum):
+    PLANNED = "planned"
+    CUSTOM = "custom"
+    INTUITIVE = "intuitive"
+    TEMPLATE = "template"  # Day of saved plan template, belongs to no mesocycle
+# Stored as its value ("planned", ...), same strings migration writes
+workout_kind_type = Enum(WorkoutKind, name="workout_kind", length=16,
+                         values_callable=lambda kinds: [kind.value for kind in kinds])
 # 3. Workouts Table
 class WorkoutPlan(UserMixin, db.Model):
     __tablename__ = "workouts"
+    __table_args__ = (
+        db.Index("ix_workouts_user_mesocycle_created", "user_id", "mesocycle_id", "created_at"),
+        db.Index("ix_workouts_user_kind_created", "user_id", "kind", "created_at"),
+        db.Index("ix_workouts_template", "template_id"),
+    )
     workout_id = Column(Integer, primary_key=True)
     user_id = Column(Integer, db.ForeignKey("users.user_id"))
     workout_name = Column(String(100), unique=False, nullable=True)
     created_at = Column(DateTime, default=func.now())  # current time / date
     mesocycle_id = Column(Integer, db.ForeignKey("mesocycles.mesocycle_id"))
+    kind = Column(workout_kind_type, nullable=False, default=WorkoutKind.PLANNED, server_default="planned")
+    template_id = Column(Integer, db.ForeignKey("plan_templates.template_id"), nullable=True)
 
     def __init__(
         self,
         user_id,
         workout_name,
-        mesocycle_id
+        mesocycle_id,
+        kind=WorkoutKind.PLANNED,
+        template_id=None,
     ):
         self.user_id = user_id
         self.workout_name = workout_name
+        self.kind = kind
         self.mesocycle_id = mesocycle_id
+        self.template_id = template_id
         # created_at is not here because SQLAlchemy will take care of it
 # 4. WorkoutExercises Table
 class WorkoutExercises(UserMixin, db.Model):
     __tablename__ = "workout_exercises"
+    __table_args__ = (
+        db.Index("ix_workout_exercises_workout_exercise", "workout_id", "exercise_id"),
+        # Current rows of a day in plan order - one seek for every reader of the current plan
+        db.Index("ix_workout_exercises_workout_current", "workout_id", "to_version", "order_in_workout"),
+    )
     workout_exercise_id = Column(Integer, primary_key=True)
     workout_id = Column(Integer, db.ForeignKey("workouts.workout_id"))
     exercise_id = Column(Integer, db.ForeignKey("exercises.exercise_id"))
     order_in_workout = Column(Integer, unique=False, nullable=False)
     prescribed_sets = Column(Integer, unique=False, nullable=False)
     rest_period = Column(Integer, unique=False, nullable=False)
-    # deleted = Column(Boolean, nullable=False, default=False)
+    # Copy-on-write plan: row is never changed, plan edit closes it (to_version) and inserts
+    # new row. Row belongs to users.plan_version v when from_version <= v < to_version,
+    # to_version NULL = row is in current plan
+    from_version = Column(Integer, nullable=False, default=0, server_default="0")
+    to_version = Column(Integer, nullable=True)
 
     def __init__(
         self,
@@ -154,25 +231,42 @@ class WorkoutExercises(UserMixin, db.Model):
         self.order_in_workout = order_in_workout
         self.prescribed_sets = prescribed_sets
         self.rest_period = rest_period
-        # self.deleted = deleted
 # 5. Sessions Table
 # High-level information about each workout session, such as the date, user, and overall notes
 class Sessions(UserMixin, db.Model):
     __tablename__ = "sessions"
+    __table_args__ = (
+        db.Index("ix_sessions_user_workout_date", "user_id", "workout_id", "session_date"),
+        db.Index("ix_sessions_user_training_day", "user_id", "training_day", "workout_id"),
+        db.Index("ix_sessions_user_kind_date", "user_id", "kind", "session_date"),
+    )
     session_id = Column(Integer, primary_key=True)
     user_id = Column(Integer, db.ForeignKey("users.user_id"))
     workout_id = Column(Integer, db.ForeignKey("workouts.workout_id"))
     session_date = Column(DateTime, default=func.now())
     notes = Column(String(150), unique=False, nullable=True)
     session_end = Column(DateTime, unique=True, nullable=True)
+    # Calendar day of session in user's timezone (session_date is UTC)
+    training_day = Column(Date, nullable=True, default=lambda: default_training_day())
+    kind = Column(workout_kind_type, nullable=False, default=WorkoutKind.PLANNED, server_default="planned")
+    # Plan version session was performed against, see WorkoutExercises.from_version
+    plan_version = Column(Integer, nullable=True, default=lambda: default_plan_version())
 
-    def __init__(self, user_id, workout_id, notes):
+    def __init__(self, user_id, workout_id, notes, kind=WorkoutKind.PLANNED):
         self.user_id = user_id
         self.workout_id = workout_id
         self.notes = notes
+        self.kind = kind
 # 6. ExerciseEntries Table
 class ExerciseEntries(UserMixin, db.Model):
     __tablename__ = "exercise_entries"
+    __table_args__ = (
+        # Set numbers are unique per exercise in session; also serves (session_id, exercise_id) lookups
+        db.Index("ux_exercise_entries_session_exercise_set", "session_id", "exercise_id", "set_number", unique=True),
+        db.Index("ix_exercise_entries_exercise_session", "exercise_id", "session_id"),
+        # Set sent twice with same client key (retry, refresh) is stored once
+        db.Index("ux_exercise_entries_session_client_key", "session_id", "client_key", unique=True),
+    )
     entry_id = Column(Integer, primary_key=True)
     session_id = Column(Integer, db.ForeignKey("sessions.session_id"))
     exercise_id = Column(Integer, db.ForeignKey("exercises.exercise_id"))
@@ -181,8 +275,9 @@ class ExerciseEntries(UserMixin, db.Model):
     weight = Column(Float, unique=False, nullable=True)
     rpe = Column(Float, unique=False, nullable=True)
     notes = Column(String(150), unique=False, nullable=True)
+    client_key = Column(String(36), unique=False, nullable=True)
 
-    def __init__(self, session_id, exercise_id, set_number, reps, weight, rpe, notes):
+    def __init__(self, session_id, exercise_id, set_number, reps, weight, rpe, notes, client_key=None):
         self.session_id = session_id
         self.exercise_id = exercise_id
         self.set_number = set_number
@@ -190,10 +285,14 @@ class ExerciseEntries(UserMixin, db.Model):
         self.weight = weight
         self.rpe = rpe
         self.notes = notes
+        self.client_key = client_key
 
 # 7. Mesocycles Table
 class Mesocycles(UserMixin, db.Model):
     __tablename__ = "mesocycles"
+    __table_args__ = (
+        db.Index("ix_mesocycles_user_mesocycle", "user_id", "mesocycle_id"),
+    )
     mesocycle_id = Column(Integer, primary_key=True)
     user_id = Column(Integer, db.ForeignKey("users.user_id"))
     name = Column(String(100), unique=False, nullable=False)
@@ -219,6 +318,25 @@ class SessionMesocycles(UserMixin, db.Model):
         self.session_id = session_id
         self.mesocycle_id = mesocycle_id
         self.training_day_number = training_day_number
+# 9. PlanTemplates Table
+# Saved weekly plan new mesocycle can start from; its days are workouts of kind "template"
+class PlanTemplates(UserMixin, db.Model):
+    __tablename__ = "plan_templates"
+    __table_args__ = (
+        db.Index("ix_plan_templates_user", "user_id", "template_id"),
+    )
+    template_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, db.ForeignKey("users.user_id"))
+    name = Column(String(100), unique=False, nullable=False)
+    mesocycle_duration_weeks = Column(Integer, unique=False, nullable=False)
+    workouts_per_week = Column(Integer, unique=False, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+
+    def __init__(self, user_id, name, mesocycle_duration_weeks, workouts_per_week):
+        self.user_id = user_id
+        self.name = name
+        self.mesocycle_duration_weeks = mesocycle_duration_weeks
+        self.workouts_per_week = workouts_per_week
 @login_manager.user_loader
 def load_user(user_id):
     stmt = select(Users).where(Users.user_id == int(user_id))
@@ -241,100 +359,266 @@ class LoginForm(FlaskForm):
 
 
 # --------------------------------------------------------------------------------------------------------------------------------------
+# Request scoped user context ---------------------------------------------
+# Flask-Login already loaded the user's row in load_user, so identity, latest mesocycle
+# and active workout ids are resolved once per request and shared through flask.g
+def user_context() -> dict:
+    context = g.get("user_context")
+    if context is None:
+        context = {"user_id": current_user.user_id}
+        g.user_context = context
+        g.user_lookups_saved = 0
+    else:
+        g.user_lookups_saved += 1
+    return context
 def current_user_id_db() -> str:
-    user = Users.query.filter_by(username=current_user.username).first()
-    return user.user_id
-def find_users_weeks():
-    user = Users.query.filter_by(username=current_user.username).first()
-    if not user:
-        print("User not found.")
-        return None, None, None  # Handle case where user is not found
-
-    user_id_db = user.user_id
-    # Retrieve last mesocycle's data from my table
-    last_meso_query = (db.session.query(Mesocycles)
-                       .filter(Mesocycles.user_id == user_id_db)
-                       .order_by(Mesocycles.mesocycle_id.desc())
-                       .first())
-
-    per_week_db = (
-        db.session.query(Mesocycles.workouts_per_week)
-        .filter(Mesocycles.user_id == user_id_db)
+    return user_context()["user_id"]
+# Latest mesocycle of current user as dict (or None if user has no mesocycle yet)
+def latest_mesocycle():
+    context = user_context()
+    if "mesocycle" in context:
+        g.user_lookups_saved += 1
+        return context["mesocycle"]
+
+    last_meso_query = (
+        db.session.query(
+            Mesocycles.mesocycle_id,
+            Mesocycles.name,
+            Mesocycles.workouts_per_week,
+        )
+        .filter(Mesocycles.user_id == context["user_id"])
         .order_by(Mesocycles.mesocycle_id.desc())
         .first()
     )
+    context["mesocycle"] = last_meso_query._asdict() if last_meso_query else None
+    return context["mesocycle"]
+# Training day ------------------------------------------------------------
+# session_date is UTC (CURRENT_TIMESTAMP) but "today" means user's calendar day. Sessions
+# store that day in training_day, so today's session is one seek on ix_sessions_user_training_day
+def user_timezone() -> ZoneInfo:
+    context = user_context()
+    if "timezone" not in context:
+        try:
+            context["timezone"] = ZoneInfo(current_user.timezone or "UTC")
+        except (ZoneInfoNotFoundError, ValueError):
+            context["timezone"] = ZoneInfo("UTC")
+    return context["timezone"]
+def user_today() -> date:
+    return datetime.now(user_timezone()).date()
+# User's today as naive UTC [start, end) - for range filters on UTC DateTime columns
+def user_day_bounds() -> tuple:
+    tz = user_timezone()
+    today = user_today()
+    start = datetime.combine(today, datetime.min.time(), tz)
+    end = datetime.combine(today + timedelta(days=1), datetime.min.time(), tz)
+    return tuple(bound.astimezone(timezone.utc).replace(tzinfo=None) for bound in (start, end))
+# Column default of Sessions.training_day - inserts outside of a request (CLI, scripts) use UTC day
+def default_training_day() -> date:
+    if has_request_context() and current_user.is_authenticated:
+        return user_today()
+    return datetime.now(timezone.utc).date()
+def default_plan_version():
+    if has_request_context() and current_user.is_authenticated:
+        return current_user.plan_version
+    return None
+# Today's session_id of current user (optionally for given workout), None if not started yet
+def get_today_session(workout_id=None):
+    stmt = select(Sessions.session_id).where(
+        Sessions.user_id == current_user_id_db(),
+        Sessions.training_day == user_today(),
+    )
+    if workout_id is not None:
+        stmt = stmt.where(Sessions.workout_id == workout_id)
+    return db.session.execute(stmt.order_by(desc(Sessions.session_id)).limit(1)).scalar()
+# workout_id behind chosen day: WorkoutKind.CUSTOM -> today's custom workout,
+# anything else is name of planned day -> its latest workout
+def day_workout_id(chosen_day):
+    stmt = select(WorkoutPlan.workout_id).where(WorkoutPlan.user_id == current_user_id_db())
+    if chosen_day == WorkoutKind.CUSTOM:
+        today, tomorrow = user_day_bounds()
+        stmt = stmt.where(
+            WorkoutPlan.kind == WorkoutKind.CUSTOM,
+            WorkoutPlan.created_at >= today,
+            WorkoutPlan.created_at < tomorrow,
+        )
+    else:
+        stmt = stmt.where(WorkoutPlan.kind == WorkoutKind.PLANNED, WorkoutPlan.workout_name == chosen_day)
+    return db.session.execute(stmt.order_by(desc(WorkoutPlan.created_at)).limit(1)).scalar()
+@app.after_request
+def user_context_header(response):
+    # How many user / mesocycle lookups were answered from request context
+    if "user_lookups_saved" in g:
+        response.headers["X-User-Lookups-Saved"] = str(g.user_lookups_saved)
+    return response
+# Plan cache ---------------------------------------------------------------
+# Assembled plans are kept in LRU cache keyed by (user_id, plan_version). Version lives in
+# users table (loaded by load_user anyway) and is bumped in the same transaction as any
+# write to plan tables, so stale entries are never hit - they just fall out of the LRU
+PLAN_TABLES = (Mesocycles, WorkoutPlan, WorkoutExercises)
+
+plan_cache = OrderedDict()
+plan_cache_lock = threading.Lock()
+plan_cache_stats = {"hits": 0, "misses": 0}
+def plan_cache_get(key):
+    with plan_cache_lock:
+        plan = plan_cache.get(key)
+        if plan is None:
+            plan_cache_stats["misses"] += 1
+            return None
+        plan_cache.move_to_end(key)
+        plan_cache_stats["hits"] += 1
+        return plan
+def plan_cache_put(key, plan) -> None:
+    with plan_cache_lock:
+        plan_cache[key] = plan
+        plan_cache.move_to_end(key)
+        while len(plan_cache) > app.config["PLAN_CACHE_SIZE"]:
+            plan_cache.popitem(last=False)
+@event.listens_for(Session, "do_orm_execute")
+def mark_bulk_plan_change(orm_execute_state):
+    # Bulk query(...).update() / .delete() and insert() / update() / delete() statements on plan tables
+    mapper = orm_execute_state.bind_mapper
+    is_bulk = orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete
+    if is_bulk and mapper is not None:
+        if issubclass(mapper.class_, PLAN_TABLES):
+            orm_execute_state.session.info["plan_changed"] = True
+@event.listens_for(Session, "after_flush")
+def mark_plan_change(db_session, flush_context):
+    # Every flush (explicit, autoflush before a query or the one of commit) - objects are
+    # gone from new / dirty / deleted after it, so they are checked here and not at commit
+    changed_objects = list(db_session.new) + list(db_session.dirty) + list(db_session.deleted)
+    if any(isinstance(obj, PLAN_TABLES) for obj in changed_objects):
+        db_session.info["plan_changed"] = True
+@event.listens_for(Session, "before_commit")
+def bump_plan_version(db_session):
+    # before_commit runs before commit's own flush - flush pending objects so they are marked
+    db_session.flush()
+
+    # Plan API moved the version itself (guarded by version client edited)
+    version_bumped = db_session.info.pop("plan_version_bumped", False)
+    if db_session.info.pop("plan_changed", False) and has_request_context() and current_user.is_authenticated:
+        if not version_bumped:
+            db_session.execute(
+                update(Users)
+                .where(Users.user_id == current_user.user_id)
+                .values(plan_version=Users.plan_version + 1)
+            )
+        # Plan loaded earlier in this request is not valid anymore
+        if "user_context" in g:
+            g.user_context.pop("active_plan", None)
+@event.listens_for(Session, "after_rollback")
+def forget_plan_change(db_session):
+    db_session.info.pop("plan_changed", None)
+    db_session.info.pop("plan_version_bumped", None)
+# Whole weekly structure of the active plan (latest mesocycle) in one statement:
+# mesocycle -> workout days -> exercises with sets / rest / name
+def load_active_plan():
+    context = user_context()
+    if "active_plan" in context:
+        g.user_lookups_saved += 1
+        return context["active_plan"]
+
+    user_id_db = context["user_id"]
+    cache_key = (user_id_db, current_user.plan_version)
+    plan = plan_cache_get(cache_key)
+    if plan is not None:
+        context["active_plan"] = plan
+        return plan
+
+    latest_meso = (
+        select(Mesocycles.mesocycle_id, Mesocycles.workouts_per_week)
+        .where(Mesocycles.user_id == user_id_db)
+        .order_by(Mesocycles.mesocycle_id.desc())
+        .limit(1)
+        .cte("latest_meso")
+    )
 
-    if per_week_db and per_week_db[0]:  # Check if per_week_db exists and contains a value
-        last_workouts = (
-            WorkoutPlan.query
-            .filter(
+    # Day number is the position of workout in the plan, same order as before (newest first)
+    plan_days = (
+        select(
+            latest_meso.c.workouts_per_week,
+            WorkoutPlan.workout_id,
+            WorkoutPlan.workout_name,
+            func.row_number()
+            .over(order_by=(WorkoutPlan.created_at.desc(), WorkoutPlan.workout_id))
+            .label("day"),
+        )
+        .select_from(latest_meso)
+        .outerjoin(
+            WorkoutPlan,
+            and_(
+                WorkoutPlan.mesocycle_id == latest_meso.c.mesocycle_id,
                 WorkoutPlan.user_id == user_id_db,
-                WorkoutPlan.mesocycle_id == last_meso_query.mesocycle_id,
                 WorkoutPlan.workout_name.isnot(None),
-                WorkoutPlan.workout_name != "c"
-            )
-            .order_by(desc(WorkoutPlan.created_at))
-            .limit(per_week_db[0])
-            .all()
+                WorkoutPlan.kind == WorkoutKind.PLANNED,
+            ),
         )
-        #print(f"Last workouts: {last_workouts}")
-
-        try:
-            last_workouts_id = (
-                db.session.query(WorkoutPlan.workout_id)
-                .filter(WorkoutPlan.workout_name != "c",
-                        WorkoutPlan.user_id == user_id_db,
-                         WorkoutPlan.mesocycle_id == last_meso_query.mesocycle_id,
-                         WorkoutPlan.workout_name.isnot(None),)
-                .order_by(WorkoutPlan.created_at.desc())
-                .limit(per_week_db[0])
-                .all()
-            )
-            
+        .subquery("plan_days")
+    )
 
-            workouts_id = [x[0] for x in last_workouts_id] if last_workouts_id else []
-        except Exception as e:
-            workouts_id = []
-            db.session.rollback()
+    plan_query = (
+        select(
+            plan_days.c.workouts_per_week,
+            plan_days.c.workout_id,
+            plan_days.c.workout_name,
+            WorkoutExercises.workout_exercise_id,
+            WorkoutExercises.prescribed_sets,
+            WorkoutExercises.rest_period,
+            Exercise.exercise_name,
+        )
+        .select_from(plan_days)
+        .outerjoin(WorkoutExercises, and_(
+            WorkoutExercises.workout_id == plan_days.c.workout_id,
+            WorkoutExercises.to_version.is_(None),
+        ))
+        .outerjoin(Exercise, Exercise.exercise_id == WorkoutExercises.exercise_id)
+        .where(plan_days.c.day <= plan_days.c.workouts_per_week)
+        .order_by(plan_days.c.day, WorkoutExercises.order_in_workout, WorkoutExercises.workout_exercise_id)
+    )
 
-        workout_names_in_db = [workout.workout_name for workout in last_workouts]
+    plan = None
+    for row in db.session.execute(plan_query):
+        if plan is None:
+            plan = {"weekly": row.workouts_per_week, "workout_names": [], "workouts_id": [], "exercises": {}}
+
+        if row.workout_id is None:
+            continue
+
+        if row.workout_id not in plan["exercises"]:
+            plan["workout_names"].append(row.workout_name)
+            plan["workouts_id"].append(row.workout_id)
+            plan["exercises"][row.workout_id] = []
+
+        if row.exercise_name is not None:
+            plan["exercises"][row.workout_id].append({
+                "exercise": (row.exercise_name,),
+                "sets": row.prescribed_sets,
+                "pauses": row.rest_period,
+                "workout_exercise_id": row.workout_exercise_id,
+            })
+
+    if plan is None or not plan["weekly"]:
+        plan = None
+    else:
+        plan_cache_put(cache_key, plan)
 
-        return per_week_db[0], workout_names_in_db, workouts_id
+    context["active_plan"] = plan
+    return plan
+def find_users_weeks():
+    plan = load_active_plan()
+    if plan is None:
+        return None, None, None
 
-    return None, None, None
+    return plan["weekly"], list(plan["workout_names"]), list(plan["workouts_id"])
 # Append exercises to jinja_exercises nested dict - use in jinja to display added exercises
 def exercises_for_jinja(jinja_exercises, weekly, workouts_id):
-    appendable_dict = {"exercise": None, "sets": None, "pauses": None}
-    for x in range(weekly):
-        # Access exercises for specific exercises
-        exercise_details = (
-            db.session.query(
-                WorkoutExercises.exercise_id,
-                WorkoutExercises.prescribed_sets,
-                WorkoutExercises.rest_period,
-            )
-            .filter_by(workout_id=workouts_id[x])
-            .all()
-        )
-
-        if exercise_details:
-            for exes in exercise_details:
-                # We are at 1. exercise (360, 2, 120)
-                # Translate exe_id into Exe name
-
-                specific_exercise_name = (
-                    db.session.query(Exercise.exercise_name)
-                    .filter_by(exercise_id=exes[0])
-                    .first()
-                )
+    plan = load_active_plan()
+    plan_exercises = plan["exercises"] if plan else {}
 
-                appendable_dict = {
-                    "exercise": specific_exercise_name,
-                    "sets": exes[1],
-                    "pauses": exes[2],
-                }
-                # Append this to jinja_exercises
-                jinja_exercises[x].append(appendable_dict)
+    for x in range(weekly):
+        for exes in plan_exercises.get(workouts_id[x], []):
+            # Append copy, so page can't change cached plan
+            jinja_exercises[x].append(dict(exes))
 # Default order in list
 # Default dict for exercises: jinja_exercises
 def default_order(weekly):
@@ -346,298 +630,447 @@ def default_order(weekly):
         jinja_exercises[x] = []
 
     return default_order, jinja_exercises
-# Overwrite exercises, sets or rest period
-def overwrite_exercise(submitted_data, weekly, workouts_id, jinja_exercises):
-    for day in range(weekly):
-        # Reset counters for each day
-        count, count_sets, count_pauses = -1, -1, -1
-
-        # Filter keys for the current day
-        day_exercise_keys = sorted([k for k in submitted_data if k.startswith(f"exercise_{day}")])
-        day_sets_keys = sorted([k for k in submitted_data if k.startswith(f"sets_{day}")])
-        day_pauses_keys = sorted([k for k in submitted_data if k.startswith(f"pauses_{day}")])
-
-        # Process exercises for the current day
-        for key in day_exercise_keys:
-            count += 1
-            exe_name = submitted_data[key]
-
-            # Get the new exercise ID
-            exercise_id_query = (
-                db.session.query(Exercise.exercise_id)
-                .filter_by(exercise_name=exe_name)
-                .first()
-            )
-
-            if exercise_id_query:
-                current_exercise_id = exercise_id_query[0]
-
-                # Get the previous exercise ID from jinja_exercises
-                try:
-                    previous_exercise = jinja_exercises[day][count]["exercise"][0]
-                    previous_exercise_id_query = (
-                        db.session.query(Exercise.exercise_id)
-                        .filter_by(exercise_name=previous_exercise)
-                        .first()
-                    )
-
-                    if previous_exercise_id_query:
-                        # Update the exercise ID in WorkoutExercises
-                        db.session.query(WorkoutExercises).filter_by(
-                            workout_id=workouts_id[day],
-                            exercise_id=previous_exercise_id_query[0],
-                        ).update({"exercise_id": current_exercise_id})
-                except IndexError as ie:
-                    print(f"You are out of range {ie}")
-
-        # Process sets for the current day
-        count_sets = -1
-        for key in day_sets_keys:
-            count_sets += 1
-            exe_sets = submitted_data[key]
-
-            # Get the current exercise ID from jinja_exercises
-            try:
-                current_exercise_name = jinja_exercises[day][count_sets]["exercise"][0]
-                current_exercise_id_query = (
-                    db.session.query(Exercise.exercise_id)
-                    .filter_by(exercise_name=current_exercise_name)
-                    .first()
-                )
-
-                if current_exercise_id_query:
-                    current_exercise_id = current_exercise_id_query[0]
-
-                    # Update the prescribed sets in WorkoutExercises
-                    db.session.query(WorkoutExercises).filter_by(
-                        workout_id=workouts_id[day],
-                        exercise_id=current_exercise_id,
-                    ).update({"prescribed_sets": exe_sets})
-            except IndexError as ie:
-                print(f"You are out of range for sets {ie}")
-
-        # Process pauses for the current day
-        count_pauses = -1
-        for key in day_pauses_keys:
-            count_pauses += 1
-            exe_pauses = submitted_data[key]
-
-            # Get the current exercise ID from jinja_exercises
-            try:
-                current_exercise_name = jinja_exercises[day][count_pauses]["exercise"][0]
-                current_exercise_id_query = (
-                    db.session.query(Exercise.exercise_id)
-                    .filter_by(exercise_name=current_exercise_name)
-                    .first()
-                )
-
-                if current_exercise_id_query:
-                    current_exercise_id = current_exercise_id_query[0]
-
-                    # Update the rest period in WorkoutExercises
-                    db.session.query(WorkoutExercises).filter_by(
-                        workout_id=workouts_id[day],
-                        exercise_id=current_exercise_id,
-                    ).update({"rest_period": exe_pauses})
-            except IndexError as ie:
-                print(f"You are out of range for pauses {ie}")
-
-        # Commit changes after processing each day
-        db.session.commit()
-def find_workout_name_from_user(submitted_data, weekly, workout_names) -> None:
-    # Save to DB - WorkoutPlan
-    user = Users.query.filter_by(username=current_user.username).first()
-    user_id_db = user.user_id
-
-    for day in range(weekly):
-        workout_name = request.form.get(f"workout_name_{day}", None)
-
-        if workout_name != "":
-            workout_names[day] = workout_name
-            # Save / rename workout in database
-            # Find the corresponding workout by user_id and some identifier like day or created_at
-            workout = (
-                WorkoutPlan.query.filter_by(user_id=user_id_db)
-                .order_by(WorkoutPlan.created_at.desc())
-                .offset(day)
-                .first()
-            )
-            if workout:
-                workout.workout_name = workout_name  # Update workout name
-                db.session.add(workout)
-
-        db.session.commit()
-    return workout_names
-
- # Add exercise to database --- add weekly to arguments
-def add_exercise(submitted_data, order, weekly, jinja_exercises, workouts_id):
-    user = Users.query.filter_by(username=current_user.username).first()
-    user_id_db = user.user_id
-    new_exercise_order = 0
-    exercise_count = 0
-
-    # Function to make exercise dict: if no set /values are provided then set default values
-    def user_input_or_defualt():
-        prescribed_sets_user = submitted_data.get(f"new_sets_{day}", None)
-        rest_period_user = submitted_data.get(f"new_pauses_{day}", None)
-
-        rest_period = rest_period_user if rest_period_user else 120
-        prescribed_sets = prescribed_sets_user if prescribed_sets_user else 2
-
-        return rest_period, prescribed_sets
-
-    for day in range(weekly):
-        user_exe = submitted_data.get(f"new_exercise_{day}", "")
-
-        # Find exercise_id for exercise user have inputed
-        exe_id = (
-            db.session.query(Exercise).filter_by(exercise_name=user_exe).first()
+# Plan editor (create_workout POST) ----------------------------------------
+# Submitted form -> one diff against current rows of the plan -> few bulk statements:
+#   workout_name_{day}                    rename day
+#   exercise_/sets_/pauses_{day}_{idx}    change idx-th exercise of day (order of plan)
+#   remove_{day}_{idx}                    delete idx-th exercise of day
+#   new_exercise_/new_sets_/new_pauses_{day}  append exercise to day
+def form_int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+def plan_diff(submitted_data, weekly, workout_names, workouts_id) -> dict:
+    # Current exercises of every day in one statement, same order as the plan shows them
+    rows = db.session.execute(
+        select(WorkoutExercises)
+        .where(WorkoutExercises.workout_id.in_(workouts_id[:weekly]), WorkoutExercises.to_version.is_(None))
+        .order_by(WorkoutExercises.order_in_workout, WorkoutExercises.workout_exercise_id)
+    ).scalars().all()
+    day_rows = {workout_id: [] for workout_id in workouts_id[:weekly]}
+    for row in rows:
+        day_rows[row.workout_id].append(row)
+
+    diff = {"renames": [], "updates": [], "deletes": [], "inserts": [], "reorders": {}}
+    for day, workout_id in enumerate(workouts_id[:weekly]):
+        current = day_rows[workout_id]
+        day_exercise_ids = {row.exercise_id for row in current}
+
+        workout_name = submitted_data.get(f"workout_name_{day}")
+        if workout_name and workout_name != workout_names[day]:
+            diff["renames"].append({"workout_id": workout_id, "workout_name": workout_name})
+
+        for idx, row in enumerate(current):
+            if f"exercise_{day}_{idx}" not in submitted_data:
+                continue  # Day wasn't part of submitted form
+            if submitted_data.get(f"remove_{day}_{idx}"):
+                diff["deletes"].append(row.workout_exercise_id)
+                continue
+
+            changes = {}
+            exercise_id = find_exercise_id_db(submitted_data.get(f"exercise_{day}_{idx}"))
+            # Unknown name or exercise which day already has -> keep current one
+            if exercise_id and exercise_id[0] not in day_exercise_ids:
+                changes["exercise_id"] = exercise_id[0]
+                day_exercise_ids.add(exercise_id[0])
+            prescribed_sets = form_int(submitted_data.get(f"sets_{day}_{idx}"), row.prescribed_sets)
+            if prescribed_sets != row.prescribed_sets:
+                changes["prescribed_sets"] = prescribed_sets
+            rest_period = form_int(submitted_data.get(f"pauses_{day}_{idx}"), row.rest_period)
+            if rest_period != row.rest_period:
+                changes["rest_period"] = rest_period
+            if changes:
+                diff["updates"].append({
+                    "workout_exercise_id": row.workout_exercise_id,
+                    "exercise_id": row.exercise_id,
+                    "prescribed_sets": row.prescribed_sets,
+                    "rest_period": row.rest_period,
+                    **changes,
+                })
+
+        exercise_id = find_exercise_id_db(submitted_data.get(f"new_exercise_{day}", ""))
+        if exercise_id and exercise_id[0] not in day_exercise_ids:
+            diff["inserts"].append({
+                "workout_id": workout_id,
+                "exercise_id": exercise_id[0],
+                "order_in_workout": max((row.order_in_workout for row in current), default=0) + 1,
+                "prescribed_sets": form_int(submitted_data.get(f"new_sets_{day}"), 2),
+                "rest_period": form_int(submitted_data.get(f"new_pauses_{day}"), 120),
+            })
+    return diff
+# New plan version for an edit: users.plan_version + 1, moved by the edit's first write (only
+# from :expected version when given). None if plan is not at expected version anymore
+def claim_plan_version(expected=None):
+    stmt = update(Users).where(Users.user_id == current_user_id_db())
+    if expected is not None:
+        stmt = stmt.where(Users.plan_version == expected)
+    version = db.session.execute(
+        stmt.values(plan_version=Users.plan_version + 1).returning(Users.plan_version)
+    ).scalar()
+    if version is not None:
+        db.session.info["plan_version_bumped"] = True
+        db.session.info["plan_changed"] = True
+    return version
+# Changed row -> copy with new values valid from the new version, old row stays for sessions done before
+COPY_PLAN_ROW_STATEMENT = """
+    INSERT INTO workout_exercises
+        (workout_id, exercise_id, order_in_workout, prescribed_sets, rest_period, from_version)
+    SELECT workout_id, :exercise_id, order_in_workout, :prescribed_sets, :rest_period, :version
+    FROM workout_exercises
+    WHERE workout_exercise_id = :workout_exercise_id
+"""
+# One statement per kind of change (executemany for row by row values); caller commits.
+# Rows are copy-on-write: updated and deleted rows are closed at version, not rewritten. Order
+# is not history - reorder changes current rows in place before they are copied
+def apply_plan_diff(diff, version=None) -> None:
+    if not any(diff.values()):
+        return
+    if version is None:
+        version = claim_plan_version()
+
+    # New order of a day: UPDATE ... SET order_in_workout = CASE workout_exercise_id WHEN ... END
+    for workout_id, order in diff["reorders"].items():
+        db.session.execute(
+            update(WorkoutExercises)
+            .where(WorkoutExercises.workout_id == workout_id, WorkoutExercises.workout_exercise_id.in_(order))
+            .values(order_in_workout=case(
+                {row_id: number for number, row_id in enumerate(order, start=1)},
+                value=WorkoutExercises.workout_exercise_id,
+            ))
+            .execution_options(synchronize_session=False)
         )
-
-        if exe_id:
-
-            # Give me last exercise_id from workout_exercises
-            exe_in_db = (
-                db.session.query(WorkoutExercises.exercise_id)
-                .filter_by(workout_id=workouts_id[day])
-                .order_by(WorkoutExercises.workout_exercise_id.desc())
-                .all()
-            )
-
-            exercise_ids = [exercise_id[0] for exercise_id in exe_in_db]
-
-            if exe_id.exercise_id in exercise_ids:
-                # In this case don't save exercise to db -> maybe give user some info
-                print("I have this exercise in db. Nothing is going to happen.")
-
-            else:
-                print("This exercise is not in db yet. I am saving it now.")
-
-                exercise_count = (
-                    db.session.query(WorkoutExercises)
-                    .filter_by(workout_id=workouts_id[day])
-                    .count()
-                )
-
-                rest, sets = user_input_or_defualt()
-                if exercise_count >= 1:
-                    # Add new exercise to database
-                    new_exercise_order = exercise_count + 1
-                    new_exercise_entry = {
-                        "order_in_workout": new_exercise_order,  # Match with the unique input name
-                        "exercise_id": exe_id.exercise_id,  # Match with the unique input name
-                        "prescribed_sets": sets,
-                        "rest_period": rest,
-                        "workout_id": workouts_id[day],
-                    }
-
-                    new_exercise = WorkoutExercises(**new_exercise_entry)
-                    db.session.add(new_exercise)
-                    db.session.commit()
-
-                elif exercise_count == 0:
-                    new_exercise_order = exercise_count + 1
-                    new_exercise_entry = {
-                        "order_in_workout": new_exercise_order,  # Match with the unique input name
-                        "exercise_id": exe_id.exercise_id,  # Match with the unique input name
-                        "prescribed_sets": int(sets),
-                        "rest_period": int(rest),
-                        "workout_id": workouts_id[day],
+    if diff["updates"]:
+        db.session.execute(text(COPY_PLAN_ROW_STATEMENT), [{**row, "version": version} for row in diff["updates"]])
+    closed = [row["workout_exercise_id"] for row in diff["updates"]] + diff["deletes"]
+    if closed:
+        db.session.execute(
+            update(WorkoutExercises)
+            .where(WorkoutExercises.workout_exercise_id.in_(closed), WorkoutExercises.to_version.is_(None))
+            .values(to_version=version)
+            .execution_options(synchronize_session=False)
+        )
+    if diff["inserts"]:
+        db.session.execute(insert(WorkoutExercises), [{**row, "from_version": version} for row in diff["inserts"]])
+    if diff["renames"]:
+        db.session.execute(update(WorkoutPlan), diff["renames"])
+# Plan API (JSON) ------------------------------------------------------------
+# GET whole plan, PATCH with list of operations:
+#   {"op": "rename", "workout_id", "name"}
+#   {"op": "add", "workout_id", "exercise", "sets"?, "rest"?}
+#   {"op": "update", "workout_exercise_id", "exercise"?, "sets"?, "rest"?}
+#   {"op": "remove", "workout_exercise_id"}
+#   {"op": "reorder", "workout_id", "order": [workout_exercise_id, ...]}
+# Operations become the same diff as create_workout form and touch only affected rows
+MAX_PLAN_OPERATIONS = 200
+def plan_to_json(plan) -> dict:
+    return {
+        "version": current_user.plan_version,
+        "days": [
+            {
+                "workout_id": workout_id,
+                "name": workout_name,
+                "exercises": [
+                    {
+                        "workout_exercise_id": exercise["workout_exercise_id"],
+                        "exercise": exercise["exercise"][0],
+                        "sets": exercise["sets"],
+                        "rest": exercise["pauses"],
                     }
-
-                    new_exercise = WorkoutExercises(**new_exercise_entry)
-                    db.session.add(new_exercise)
-                    db.session.commit()
-
-                    print("No exercise")
-
-    return order
-# Delete function
-def delete_exercise(submitted_data, weekly, workouts_id):
-    for day in range(weekly):
-        delete_keys = [
-            key for key in submitted_data.keys() if key.startswith(f"remove_{day}_")
-        ]
-
-        for key in delete_keys:
-            parts = key.split("_")
-
-            if len(parts) == 3:
-                _, day_str, idx_str = parts
-                idx = int(idx_str)
-                delete_value = submitted_data.get(key)
-
-                exercise = submitted_data.get(f"exercise_{day}_{idx}")
-
-                specific_exercise_id = (
-                    db.session.query(Exercise.exercise_id)
-                    .filter_by(exercise_name=exercise)
-                    .first()
-                )
-
-                if specific_exercise_id:
-                    workout_id_found = (
-                        db.session.query(WorkoutExercises.workout_exercise_id)
-                        .filter_by(
-                            workout_id=workouts_id[day],
-                            exercise_id=specific_exercise_id[0],
-                        )
-                        .first()
-                    )
-                    # Remove the exercise
-                    # DELTE FROM WorkoutExercises
-                    # WHERE workout_exercise_id = workout_id_found.workout_exercise_id
-
-                    remove_exe_from_db = (
-                        db.session.query(WorkoutExercises)
-                        .filter(
-                            WorkoutExercises.workout_exercise_id
-                            == workout_id_found.workout_exercise_id
-                        )
-                        .delete(synchronize_session=False)
-                    )
-                    db.session.commit()
+                    for exercise in plan["exercises"][workout_id]
+                ],
+            }
+            for workout_id, workout_name in zip(plan["workouts_id"], plan["workout_names"])
+        ],
+    }
+# Days (with all their exercises) touched by PATCH - the changed fragment of the plan
+def plan_days_to_json(workout_ids) -> list:
+    rows = db.session.execute(
+        select(
+            WorkoutPlan.workout_id,
+            WorkoutPlan.workout_name,
+            WorkoutExercises.workout_exercise_id,
+            WorkoutExercises.prescribed_sets,
+            WorkoutExercises.rest_period,
+            Exercise.exercise_name,
+        )
+        .outerjoin(WorkoutExercises, and_(
+            WorkoutExercises.workout_id == WorkoutPlan.workout_id,
+            WorkoutExercises.to_version.is_(None),
+        ))
+        .outerjoin(Exercise, Exercise.exercise_id == WorkoutExercises.exercise_id)
+        .where(WorkoutPlan.workout_id.in_(workout_ids))
+        .order_by(WorkoutPlan.workout_id, WorkoutExercises.order_in_workout, WorkoutExercises.workout_exercise_id)
+    )
+    days = {}
+    for row in rows:
+        day = days.setdefault(row.workout_id, {"workout_id": row.workout_id, "name": row.workout_name, "exercises": []})
+        if row.workout_exercise_id is not None:
+            day["exercises"].append({
+                "workout_exercise_id": row.workout_exercise_id,
+                "exercise": row.exercise_name,
+                "sets": row.prescribed_sets,
+                "rest": row.rest_period,
+            })
+    return list(days.values())
+def plan_operation_int(operation, field, default):
+    value = operation.get(field, default)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(f"'{field}' must be non-negative int")
+    return value
+def plan_operation_exercise(operation):
+    exercise_id = find_exercise_id_db(operation.get("exercise"))
+    if exercise_id is None:
+        raise ValueError("unknown exercise")
+    return exercise_id[0]
+# Operations -> (diff for apply_plan_diff, touched workout_ids); ValueError for bad operation
+def plan_operations_diff(operations, plan):
+    rows = {
+        row.workout_exercise_id: row
+        for row in db.session.execute(
+            select(WorkoutExercises)
+            .where(WorkoutExercises.workout_id.in_(plan["workouts_id"]), WorkoutExercises.to_version.is_(None))
+        ).scalars()
+    }
+    # Pending state of every row: starts as it is in database, operations change it
+    state = {
+        row_id: {
+            "workout_exercise_id": row_id,
+            "workout_id": row.workout_id,
+            "exercise_id": row.exercise_id,
+            "order_in_workout": row.order_in_workout,
+            "prescribed_sets": row.prescribed_sets,
+            "rest_period": row.rest_period,
+        }
+        for row_id, row in rows.items()
+    }
+    diff = {"renames": [], "updates": [], "deletes": [], "inserts": [], "reorders": {}}
+    touched = set()
+
+    def day_rows(workout_id):
+        return [row for row in state.values() if row["workout_id"] == workout_id] + \
+               [row for row in diff["inserts"] if row["workout_id"] == workout_id]
+
+    def plan_workout(operation):
+        workout_id = operation.get("workout_id")
+        if workout_id not in plan["workouts_id"]:
+            raise ValueError("unknown workout_id")
+        return workout_id
+
+    def plan_row(operation):
+        row = state.get(operation.get("workout_exercise_id"))
+        if row is None:
+            raise ValueError("unknown workout_exercise_id")
+        return row
+
+    for position, operation in enumerate(operations):
+        try:
+            if not isinstance(operation, dict):
+                raise ValueError("must be object")
+            kind = operation.get("op")
+
+            if kind == "rename":
+                workout_id = plan_workout(operation)
+                name = operation.get("name")
+                if not isinstance(name, str) or not 0 < len(name) <= 100:
+                    raise ValueError("'name' must be string of 1-100 characters")
+                diff["renames"].append({"workout_id": workout_id, "workout_name": name})
+
+            elif kind == "add":
+                workout_id = plan_workout(operation)
+                exercise_id = plan_operation_exercise(operation)
+                current = day_rows(workout_id)
+                if exercise_id in {row["exercise_id"] for row in current}:
+                    raise ValueError("exercise is already in this day")
+                diff["inserts"].append({
+                    "workout_id": workout_id,
+                    "exercise_id": exercise_id,
+                    "order_in_workout": max((row["order_in_workout"] for row in current), default=0) + 1,
+                    "prescribed_sets": plan_operation_int(operation, "sets", 2),
+                    "rest_period": plan_operation_int(operation, "rest", 120),
+                })
+
+            elif kind == "update":
+                row = plan_row(operation)
+                workout_id = row["workout_id"]
+                if "exercise" in operation:
+                    exercise_id = plan_operation_exercise(operation)
+                    others = {other["exercise_id"] for other in day_rows(workout_id) if other is not row}
+                    if exercise_id in others:
+                        raise ValueError("exercise is already in this day")
+                    row["exercise_id"] = exercise_id
+                row["prescribed_sets"] = plan_operation_int(operation, "sets", row["prescribed_sets"])
+                row["rest_period"] = plan_operation_int(operation, "rest", row["rest_period"])
+
+            elif kind == "remove":
+                row = plan_row(operation)
+                workout_id = row["workout_id"]
+                del state[row["workout_exercise_id"]]
+                diff["deletes"].append(row["workout_exercise_id"])
+
+            elif kind == "reorder":
+                workout_id = plan_workout(operation)
+                order = operation.get("order")
+                saved = {row["workout_exercise_id"]: row for row in state.values() if row["workout_id"] == workout_id}
+                if not isinstance(order, list) or not all(isinstance(row_id, int) for row_id in order) \
+                        or sorted(order) != sorted(saved):
+                    raise ValueError("'order' must list every workout_exercise_id of the day once")
+                for number, row_id in enumerate(order, start=1):
+                    saved[row_id]["order_in_workout"] = number
+                diff["reorders"][workout_id] = list(order)
 
             else:
-                print(f"Unexpected key format: {key}")
+                raise ValueError("'op' must be rename, add, update, remove or reorder")
+        except ValueError as e:
+            raise ValueError(f"operation {position}: {e}")
+        touched.add(workout_id)
+
+    # Only rows which ended up different from database are written, new order goes as one CASE per day
+    diff["updates"] = [
+        {field: value for field, value in row.items() if field != "order_in_workout"}
+        for row_id, row in state.items()
+        if any(row[field] != getattr(rows[row_id], field)
+               for field in ("exercise_id", "prescribed_sets", "rest_period"))
+    ]
+    diff["reorders"] = {
+        workout_id: [row_id for row_id in order if row_id in state]
+        for workout_id, order in diff["reorders"].items()
+        if any(state[row_id]["order_in_workout"] != rows[row_id].order_in_workout
+               for row_id in order if row_id in state)
+    }
+    # Last name of a day wins; name it already has is no change
+    names = dict(zip(plan["workouts_id"], plan["workout_names"]))
+    renames = {rename["workout_id"]: rename["workout_name"] for rename in diff["renames"]}
+    diff["renames"] = [
+        {"workout_id": workout_id, "workout_name": name}
+        for workout_id, name in renames.items() if name != names[workout_id]
+    ]
+    return diff, touched
+# Mesocycle cloning and plan templates ---------------------------------------
+# Days of a mesocycle or template are copied by two INSERT ... SELECT statements (days, then
+# their exercises) whatever size the plan has. Copied day N is matched to source day N, days are
+# numbered the same way load_active_plan numbers them. Helpers don't commit
+PLAN_OWNERS = {
+    "mesocycle": ("mesocycle_id", WorkoutKind.PLANNED),
+    "template": ("template_id", WorkoutKind.TEMPLATE),
+}
+def plan_days_sql(owner, param) -> str:
+    column, kind = PLAN_OWNERS[owner]
+    return f"""
+        SELECT workout_id, workout_name,
+               ROW_NUMBER() OVER (ORDER BY created_at DESC, workout_id) AS day
+        FROM workouts
+        WHERE user_id = :user_id AND {column} = :{param} AND kind = '{kind.value}'
+          AND workout_name IS NOT NULL
+    """
+def copy_plan_days(source, source_id, target, target_id) -> None:
+    target_column, target_kind = PLAN_OWNERS[target]
+    params = {"user_id": current_user_id_db(), "source_id": source_id, "target_id": target_id}
+    source_days = plan_days_sql(source, "source_id")
+
+    # Same created_at for all copies -> ids decide their order, rows go in source day order
+    db.session.execute(text(f"""
+        INSERT INTO workouts (user_id, workout_name, created_at, {target_column}, kind)
+        SELECT :user_id, workout_name, CURRENT_TIMESTAMP, :target_id, '{target_kind.value}'
+        FROM ({source_days}) AS source_days
+        ORDER BY day
+    """), params)
+    db.session.execute(text(f"""
+        INSERT INTO workout_exercises (workout_id, exercise_id, order_in_workout, prescribed_sets, rest_period)
+        SELECT target_days.workout_id, e.exercise_id, e.order_in_workout, e.prescribed_sets, e.rest_period
+        FROM ({source_days}) AS source_days
+        JOIN ({plan_days_sql(target, "target_id")}) AS target_days ON target_days.day = source_days.day
+        JOIN workout_exercises e ON e.workout_id = source_days.workout_id AND e.to_version IS NULL
+        ORDER BY target_days.workout_id, e.order_in_workout
+    """), params)
+    # text() statements are not seen by mark_bulk_plan_change
+    db.session.info["plan_changed"] = True
+def user_mesocycle(mesocycle_id):
+    return db.session.execute(
+        select(Mesocycles).where(Mesocycles.mesocycle_id == mesocycle_id, Mesocycles.user_id == current_user_id_db())
+    ).scalar()
+def user_plan_template(template_id):
+    return db.session.execute(
+        select(PlanTemplates)
+        .where(PlanTemplates.template_id == template_id, PlanTemplates.user_id == current_user_id_db())
+    ).scalar()
+def new_mesocycle(name, duration, workouts_per_week):
+    mesocycle = Mesocycles(
+        name=name,
+        user_id=current_user_id_db(),
+        mesocycle_duration_weeks=duration,
+        workouts_per_week=workouts_per_week,
+    )
+    db.session.add(mesocycle)
+    db.session.flush()  # Flush to assign mesocycle_id
+    return mesocycle
+# Next mesocycle with the same days and exercises -> new mesocycle_id or None
+def clone_mesocycle(source_id, name, duration=None):
+    source = user_mesocycle(source_id)
+    if source is None:
+        return None
+    mesocycle = new_mesocycle(name, duration or source.mesocycle_duration_weeks, source.workouts_per_week)
+    copy_plan_days("mesocycle", source.mesocycle_id, "mesocycle", mesocycle.mesocycle_id)
+    return mesocycle.mesocycle_id
+def save_plan_template(mesocycle_id, name):
+    source = user_mesocycle(mesocycle_id)
+    if source is None:
+        return None
+    template = PlanTemplates(
+        user_id=source.user_id,
+        name=name,
+        mesocycle_duration_weeks=source.mesocycle_duration_weeks,
+        workouts_per_week=source.workouts_per_week,
+    )
+    db.session.add(template)
+    db.session.flush()
+    copy_plan_days("mesocycle", source.mesocycle_id, "template", template.template_id)
+    return template.template_id
+def instantiate_plan_template(template_id, name, duration=None):
+    template = user_plan_template(template_id)
+    if template is None:
+        return None
+    mesocycle = new_mesocycle(name, duration or template.mesocycle_duration_weeks, template.workouts_per_week)
+    copy_plan_days("template", template.template_id, "mesocycle", mesocycle.mesocycle_id)
+    return mesocycle.mesocycle_id
 # For tryining sessions mainly ---------------------------------------
+# Writes of one POST (session, new set, deleted and edited sets) go into one transaction:
+# helpers below only add / flush, the block commits once or rolls everything back.
+# Database error is logged and flashed to user, work["failed"] tells page to answer 500;
+# any other error is re-raised after rollback
+@contextmanager
+def unit_of_work():
+    work = {"failed": False}
+    try:
+        yield work
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        app.logger.exception("Request writes rolled back")
+        flash("Nothing was saved - database error, please try again.", "danger")
+        work["failed"] = True
+    except Exception:
+        db.session.rollback()
+        raise
 def add_session_to_db(chosen_day_by_user, workouts_id):
-    user = Users.query.filter_by(username=current_user.username).first()
-    user_id_db = user.user_id
+    user_id_db = current_user_id_db()
 
     # Map the chosen day to the actual workout_id
     workout_id_hopefully = workouts_id[chosen_day_by_user]
 
-    today = datetime.combine(date.today(), datetime.min.time())
-    tomorrow = today + timedelta(days=1)
-
     # Check if a session already exists for today
-    does_session_exist = (
-        db.session.query(Sessions.session_id)
-        .filter(
-            and_(
-                Sessions.workout_id == workout_id_hopefully,
-                Sessions.user_id == user_id_db,
-                Sessions.session_date >= today,
-                Sessions.session_date < tomorrow,
-            )
-        )
-        .first()
-    )
-
+    today_session = get_today_session(workout_id_hopefully)
 
-    if does_session_exist:
-        print("Sorry, there is already a workout session for today")
-    else:
+    if not today_session:
         # No session exists for today; create a new one
         new_session_query = Sessions(
             user_id=user_id_db, workout_id=workout_id_hopefully, notes="Null",
         )
         db.session.add(new_session_query)
-        db.session.commit()  # Commit here to assign session_id
+        db.session.flush()  # Flush to assign session_id
 
         # Retrieve the assigned session_id
-        session_id_result = new_session_query.session_id
+        today_session = new_session_query.session_id
 
         # Also add data to session_mesocycles
         training_day_number_query = (
@@ -649,247 +1082,353 @@ def add_session_to_db(chosen_day_by_user, workouts_id):
             .count()
         )
 
-        mesocycle_id_query = (
-            db.session.query(Mesocycles.mesocycle_id)
-            .filter(
-                Mesocycles.user_id == user_id_db,
-            )
-            .order_by(desc(Mesocycles.mesocycle_id))
-            .first()
-        )
+        last_meso = latest_mesocycle()
 
-        if session_id_result is not None and mesocycle_id_query is not None:
-            new_session_mesocycles_query = SessionMesocycles(
-                session_id=session_id_result,
-                mesocycle_id=mesocycle_id_query[0],
+        if last_meso is not None:
+            db.session.add(SessionMesocycles(
+                session_id=today_session,
+                mesocycle_id=last_meso["mesocycle_id"],
                 training_day_number=training_day_number_query,
-            )
-            db.session.add(new_session_mesocycles_query)
-            db.session.commit()
-
-    # Find relevant exercise sets for Jinja
-    last_session_query = (
-        db.session.query(Sessions.session_id)
-        .filter(
-            Sessions.user_id == user_id_db,
-            func.DATE(Sessions.session_date) == func.current_date(),
-            Sessions.workout_id == workout_id_hopefully,
-        )
-        .order_by(desc(Sessions.session_date))
-        .first()
-    )
+            ))
+    return today_session
+# Exercise catalog ---------------------------------------------------------
+# ~1600 exercises which almost never change -> loaded once into memory with name <-> id maps.
+# New exercise committed through ORM marks catalog stale and next lookup reloads it
+exercise_catalog = {"loaded": False, "version": 0, "by_name": {}, "by_id": {}, "muscle_group": {}}
+exercise_catalog_lock = threading.Lock()
+def load_exercise_catalog() -> dict:
+    rows = db.session.execute(
+        select(Exercise.exercise_id, Exercise.exercise_name, Exercise.muscle_group)
+    ).all()
 
-    if last_session_query:
-        sets_for_jinja = (
-            db.session.query(ExerciseEntries)
-            .filter(ExerciseEntries.session_id == last_session_query[0])
-            .all()
+    by_name = {row.exercise_name: row.exercise_id for row in rows}
+    by_id = {row.exercise_id: row.exercise_name for row in rows}
+    muscle_group = {row.exercise_id: row.muscle_group for row in rows}
+
+    # Swap whole maps at once, readers never see half loaded catalog
+    with exercise_catalog_lock:
+        exercise_catalog.update(
+            loaded=True,
+            version=exercise_catalog["version"] + 1,
+            by_name=by_name,
+            by_id=by_id,
+            muscle_group=muscle_group,
         )
-
-        return sets_for_jinja
+    return exercise_catalog
+def get_exercise_catalog() -> dict:
+    if not exercise_catalog["loaded"]:
+        return load_exercise_catalog()
+    return exercise_catalog
+def invalidate_exercise_catalog() -> None:
+    with exercise_catalog_lock:
+        exercise_catalog["loaded"] = False
+@event.listens_for(Session, "before_commit")
+def mark_exercise_catalog_change(db_session):
+    if any(isinstance(obj, Exercise) for obj in list(db_session.new) + list(db_session.dirty) + list(db_session.deleted)):
+        db_session.info["exercise_catalog_changed"] = True
+@event.listens_for(Session, "after_commit")
+def reload_exercise_catalog(db_session):
+    # No SQL allowed here, catalog is reloaded lazily by next lookup
+    if db_session.info.pop("exercise_catalog_changed", False):
+        invalidate_exercise_catalog()
 def find_exercise_id_db(exercise):
-    find_exercise_query = (
-        db.session.query(Exercise.exercise_id)
-        .filter(Exercise.exercise_name == exercise)
-        .first()
-    )
+    exercise_id = get_exercise_catalog()["by_name"].get(exercise)
 
-    if find_exercise_query:
-        return find_exercise_query
+    if exercise_id is not None:
+        return (exercise_id,)
     else:
         return None
 def find_exercise_name_db(id):
-    find_exercise_query = (
-        db.session.query(Exercise.exercise_name)
-        .filter(Exercise.exercise_id == id)
-        .first()
-    )
+    exercise_name = get_exercise_catalog()["by_id"].get(id)
 
-    if find_exercise_query:
-        return find_exercise_query
+    if exercise_name is not None:
+        return (exercise_name,)
     else:
         return None
+# Exercise search (SQLite FTS5) ---------------------------------------------
+# External content FTS table over exercises, triggers keep it in sync with every write
+EXERCISE_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS exercises_fts USING fts5(
+        exercise_name, muscle_group,
+        content='exercises', content_rowid='exercise_id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS exercises_fts_insert AFTER INSERT ON exercises BEGIN
+        INSERT INTO exercises_fts(rowid, exercise_name, muscle_group)
+        VALUES (new.exercise_id, new.exercise_name, new.muscle_group);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS exercises_fts_delete AFTER DELETE ON exercises BEGIN
+        INSERT INTO exercises_fts(exercises_fts, rowid, exercise_name, muscle_group)
+        VALUES ('delete', old.exercise_id, old.exercise_name, old.muscle_group);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS exercises_fts_update AFTER UPDATE ON exercises BEGIN
+        INSERT INTO exercises_fts(exercises_fts, rowid, exercise_name, muscle_group)
+        VALUES ('delete', old.exercise_id, old.exercise_name, old.muscle_group);
+        INSERT INTO exercises_fts(rowid, exercise_name, muscle_group)
+        VALUES (new.exercise_id, new.exercise_name, new.muscle_group);
+    END""",
+    # Index rows which were in exercises before FTS table existed
+    "INSERT INTO exercises_fts(exercises_fts) VALUES ('rebuild')",
+]
+# Name matches weigh more than muscle group matches
+EXERCISE_SEARCH_WEIGHTS = "10.0, 1.0"
+# "incline dumbbell" -> "incline"* "dumbbell"* (every word as prefix, all words must match)
+def exercise_search_expression(search_term) -> str:
+    words = re.findall(r"\w+", search_term.lower())
+    return " ".join(f'"{word}"*' for word in words)
+def search_exercises(search_term, muscle_groups=None, limit=20) -> dict:
+    match = exercise_search_expression(search_term)
+    if not match:
+        return {"results": [], "facets": {}}
+
+    group_filter = "AND e.muscle_group IN :muscle_groups" if muscle_groups else ""
+    results_query = text(f"""
+        SELECT e.exercise_id, e.exercise_name, e.muscle_group,
+               bm25(exercises_fts, {EXERCISE_SEARCH_WEIGHTS}) AS score
+        FROM exercises_fts
+        JOIN exercises e ON e.exercise_id = exercises_fts.rowid
+        WHERE exercises_fts MATCH :match {group_filter}
+        ORDER BY score
+        LIMIT :limit
+    """)
+    params = {"match": match, "limit": limit}
+    if muscle_groups:
+        results_query = results_query.bindparams(bindparam("muscle_groups", expanding=True))
+        params["muscle_groups"] = list(muscle_groups)
+
+    # Facet counts are for whole match, so user sees how many hits are in other groups
+    facets_query = text("""
+        SELECT e.muscle_group, count(*) AS hits
+        FROM exercises_fts
+        JOIN exercises e ON e.exercise_id = exercises_fts.rowid
+        WHERE exercises_fts MATCH :match
+        GROUP BY e.muscle_group
+        ORDER BY hits DESC
+    """)
+
+    results = db.session.execute(results_query, params).all()
+    facets = db.session.execute(facets_query, {"match": match}).all()
+
+    return {
+        "results": [
+            {
+                "exercise_id": row.exercise_id,
+                "exercise": row.exercise_name,
+                "muscle_group": row.muscle_group,
+                "score": round(row.score, 4),
+            }
+            for row in results
+        ],
+        "facets": {row.muscle_group: row.hits for row in facets},
+    }
+# Exercise autocomplete index ----------------------------------------------
+# Built from catalog: sorted names for prefix search, sorted words for word prefix search
+# and trigram postings for substring search. Rebuilt whenever catalog version changes
+exercise_suggest_index = {"index": None}
+def build_exercise_suggest_index(catalog) -> dict:
+    names = sorted(catalog["by_name"], key=str.lower)
+    lowered = [name.lower() for name in names]
+
+    words = sorted(
+        (word, i)
+        for i, name in enumerate(lowered)
+        for word in set(re.split(r"[^a-z0-9]+", name))
+        if word
+    )
+
+    trigrams = {}
+    for i, name in enumerate(lowered):
+        for j in range(len(name) - 2):
+            trigrams.setdefault(name[j:j + 3], set()).add(i)
+
+    return {
+        "version": catalog["version"],
+        "names": names,
+        "lowered": lowered,
+        "words": [word for word, _ in words],
+        "word_owners": [i for _, i in words],
+        "trigrams": trigrams,
+    }
+def get_exercise_suggest_index() -> dict:
+    catalog = get_exercise_catalog()
+    index = exercise_suggest_index["index"]
+    if index is None or index["version"] != catalog["version"]:
+        index = build_exercise_suggest_index(catalog)
+        exercise_suggest_index["index"] = index
+    return index
+# Ranked suggestions: exact name, name prefix, word prefix, substring. Shorter names first
+def suggest_exercises(search_term, limit=None) -> list:
+    term = " ".join(search_term.lower().split())
+    if not term:
+        return []
+    limit = limit or app.config["SUGGESTIONS_LIMIT"]
+
+    index = get_exercise_suggest_index()
+    lowered = index["lowered"]
+    ranks = {}
+
+    # 1. Whole name starts with term
+    i = bisect.bisect_left(lowered, term)
+    while i < len(lowered) and lowered[i].startswith(term):
+        ranks[i] = 0 if lowered[i] == term else 1
+        i += 1
+
+    # 2. Some word of name starts with term
+    words = index["words"]
+    i = bisect.bisect_left(words, term)
+    while i < len(words) and words[i].startswith(term):
+        ranks.setdefault(index["word_owners"][i], 2)
+        i += 1
+
+    # 3. Term anywhere in name - candidates from trigram postings, smallest first
+    if len(term) >= 3:
+        postings = sorted(
+            (index["trigrams"].get(term[j:j + 3], set()) for j in range(len(term) - 2)),
+            key=len,
+        )
+        candidates = set(postings[0]).intersection(*postings[1:]) if postings[0] else set()
+        for i in candidates:
+            if i not in ranks and term in lowered[i]:
+                ranks[i] = 3
+
+    best = heapq.nsmallest(limit, ranks, key=lambda i: (ranks[i], len(lowered[i]), lowered[i]))
+    return [index["names"][i] for i in best]
+# Next set_number is taken inside the INSERT itself (first set of exercise is 0), so two
+# overlapping requests can't get the same number; unique index guards it anyway.
+# Repeated client_key does nothing - unique (session_id, client_key) index
+INSERT_SET_STATEMENT = """
+    INSERT INTO exercise_entries (session_id, exercise_id, set_number, reps, weight, rpe, notes, client_key)
+    VALUES (
+        :session_id, :exercise_id,
+        (SELECT coalesce(max(set_number) + 1, 0) FROM exercise_entries
+         WHERE session_id = :session_id AND exercise_id = :exercise_id),
+        :reps, :weight, :rpe, :notes, :client_key
+    )
+    ON CONFLICT (session_id, client_key) DO NOTHING
+"""
+INSERT_SET_QUERY = text(INSERT_SET_STATEMENT + """
+    RETURNING entry_id, session_id, exercise_id, set_number, reps, weight, rpe, notes, client_key
+""")
+# Log next set of exercise into session - one statement.
+# With client_key the set is stored once, repeated submit returns the stored set
+def insert_set(session_id, exercise_id, reps, weight, rpe, notes, client_key=None):
+    entry = db.session.execute(INSERT_SET_QUERY, {
+        "session_id": session_id, "exercise_id": exercise_id, "reps": reps,
+        "weight": weight, "rpe": rpe, "notes": notes, "client_key": client_key,
+    }).first()
+    if entry is None:
+        return stored_sets(session_id, [client_key])[0]
+    return entry
+def stored_sets(session_id, client_keys) -> list:
+    return (
+        db.session.query(ExerciseEntries)
+        .filter(ExerciseEntries.session_id == session_id, ExerciseEntries.client_key.in_(client_keys))
+        .order_by(ExerciseEntries.entry_id)
+        .all()
+    )
+# Sets queued by client (e.g. offline in the gym) in one transaction and one executemany.
+# Every set carries client_key; keys already stored are skipped, so a replayed batch adds nothing
+def insert_sets(session_id, sets) -> list:
+    db.session.execute(text(INSERT_SET_STATEMENT), [{**item, "session_id": session_id} for item in sets])
+
+    entries = {entry.client_key: entry for entry in stored_sets(session_id, [item["client_key"] for item in sets])}
+    return [entries[key] for key in dict.fromkeys(item["client_key"] for item in sets)]
+# Set values shared by training forms and JSON set API: same types as exercise_entries columns
+SET_FIELDS = {"reps": int, "weight": float, "rpe": float, "notes": str}
+# Validated set values from form or JSON body, raises ValueError with message for user
+def parse_set_fields(data, partial=False) -> dict:
+    values = {}
+    for field, convert in SET_FIELDS.items():
+        value = data.get(field)
+        if value is None or value == "":
+            if not partial:
+                values[field] = "" if field == "notes" else 0
+            continue
+        try:
+            values[field] = convert(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"'{field}' must be {convert.__name__}")
+    if "notes" in values and len(values["notes"]) > 150:
+        raise ValueError("'notes' is longer than 150 characters")
+    return values
 def add_set_to_db(submitted_data, exercise, chosen_day) -> dict:
-    user = Users.query.filter_by(username=current_user.username).first()
-    user_id_db = user.user_id
+    user_id_db = current_user_id_db()
 
     if exercise is not None:
-        workout_id_from_db = (
-            db.session.query(WorkoutPlan.workout_id)
-            .filter(
-                WorkoutPlan.user_id == user_id_db,
-                WorkoutPlan.workout_name == chosen_day,
-            )
-            .order_by(desc(WorkoutPlan.created_at))
-            .first()
-        )
+        workout_id_from_db = day_workout_id(chosen_day)
 
-        # Add set to database - exercise_entries
-        # SELECT session_id FROM Sessions WHERE workout_id = my_workout_id ORDER BY session_id DESC
+        # Add set to database - exercise_entries, always into today's session
         if workout_id_from_db is not None:
-            
-            session_id_form_db = (
-                db.session.query(Sessions.session_id)
-                .filter(Sessions.workout_id == workout_id_from_db[0])
-                .order_by(desc(Sessions.session_date)).first()
-            )
-
-            if not session_id_form_db:
-                session_id_form_db = (
-                db.session.query(Sessions.session_id)
-                .filter(Sessions.workout_id == chosen_day)
-                .order_by(desc(Sessions.session_date)).first()
-            )
+            session_id = get_today_session(workout_id_from_db)
+            if not session_id:
+                return None
 
             exe_id = find_exercise_id_db(exercise)
 
+            if not submitted_data.get("reps") and not submitted_data.get("kg"):
+                # New set row not filled in (e.g. only saved sets were edited) -> nothing to add
+                return None
             try:
-                # Find total sets in ExerciseEntries
-                sets_yet = (
-                    db.session.query(ExerciseEntries.set_number)
-                    .filter(
-                        ExerciseEntries.session_id == session_id_form_db[0],
-                        ExerciseEntries.exercise_id == exe_id[0],
-                    )
-                    .count()
-                )
-            except TypeError:
-                db.session.rollback()
-                print("Bro, there is no session yet, but I will set 0 for you")
-                sets_yet = 0
-                sets_yet += 1
-
-            # Check if user didn't refresh website / if so it would add another set
-            # So check if there is not the
-
-            # Save exdrcise entry into database
-            try:
-                exercise_entry_add = ExerciseEntries(
-                    session_id=session_id_form_db[0],
-                    exercise_id=exe_id[0],
-                    set_number=sets_yet,
-                    reps=int(submitted_data.get("reps", 0)),
-                    weight=float(submitted_data.get("kg", 0.0)),
-                    rpe=int(submitted_data.get("rpe", 0)),
-                    notes=submitted_data.get("notes", ""),
-                )
-                db.session.add(exercise_entry_add)
-                db.session.commit()
-            except Exception as e:
-                print(f"Exception line {inspect.currentframe().f_lineno}: {e}")
-                db.session.rollback()           
-def repeat_set(chosen_exercise, workout_id, chosen_day):
-    if chosen_exercise:
-        user_id = current_user_id_db()
-        last_session, workout_id_current = user_last_session_id(workout_id, chosen_day)
-        exercise_id = find_exercise_id_db(chosen_exercise)[0]
-
-        today = datetime.combine(date.today(), datetime.min.time())
-        tomorrow = today + timedelta(days=1)
-
-        if last_session:
-            for x in last_session:
-                # Find last exercise entry for current user
-                last_exercise_query = db.session.query(ExerciseEntries).filter(
-                    ExerciseEntries.session_id == x.session_id,
-                    ExerciseEntries.exercise_id == exercise_id
-                ).order_by(desc(ExerciseEntries.exercise_id)).first()
-                if last_exercise_query:
-                    break
-        else:
-            # If exercise was never done by user, there is nothing to copy
-            return None
-
-        try:
-            sets_yet = (
-                        db.session.query(ExerciseEntries.set_number)
-                        .filter(
-                            ExerciseEntries.session_id == x.session_id,
-                            ExerciseEntries.exercise_id == last_exercise_query.exercise_id,
-                        )
-                        .count()
-                    )
-        except:
-            sets_yet = 0
-
-        if not sets_yet:
-            sets_yet = 0
+                # Form names weight "kg"
+                values = parse_set_fields({**submitted_data, "weight": submitted_data.get("kg")})
+            except ValueError as e:
+                flash(f"Set was not saved: {e}", "danger")
+                return None
 
-        # Current session
-        workout_id_from_db = (
-            db.session.query(WorkoutPlan.workout_id)
-            .filter(
-                WorkoutPlan.user_id == user_id,
-                WorkoutPlan.workout_name == chosen_day,
+            # Save exdrcise entry into database (committed by caller's unit_of_work)
+            insert_set(
+                session_id,
+                exe_id[0],
+                **values,
+                client_key=submitted_data.get("client_key") or None,
             )
-            .order_by(desc(WorkoutPlan.created_at))
-            .first()
+# Repeat = copy user's latest set of the exercise (today's, or from last time) into session.
+# INSERT ... SELECT walks ix_exercise_entries_exercise_session backwards to first set of this user
+REPEAT_SET_QUERY = text("""
+    INSERT INTO exercise_entries (session_id, exercise_id, set_number, reps, weight, rpe, notes)
+    SELECT :session_id, e.exercise_id,
+           (SELECT coalesce(max(t.set_number) + 1, 0) FROM exercise_entries t
+            WHERE t.session_id = :session_id AND t.exercise_id = e.exercise_id),
+           e.reps, e.weight, e.rpe, ''
+    FROM exercise_entries e CROSS JOIN sessions s ON s.session_id = e.session_id
+    WHERE e.exercise_id = :exercise_id AND s.user_id = :user_id
+    ORDER BY e.session_id DESC, e.entry_id DESC LIMIT 1
+    RETURNING entry_id, session_id, exercise_id, set_number, reps, weight, rpe, notes
+""")
+# Whole previous session of the same workout copied into session - pre-filled day.
+# Previous = latest earlier session with sets (skipped or empty sessions are passed over).
+# Exercises which already have sets in session are skipped, so second click adds nothing
+COPY_PREVIOUS_SESSION_QUERY = text("""
+    INSERT INTO exercise_entries (session_id, exercise_id, set_number, reps, weight, rpe, notes)
+    SELECT :session_id, e.exercise_id,
+           ROW_NUMBER() OVER (PARTITION BY e.exercise_id ORDER BY e.set_number, e.entry_id) - 1,
+           e.reps, e.weight, e.rpe, ''
+    FROM exercise_entries e
+    WHERE e.session_id = (
+            SELECT p.session_id FROM sessions t JOIN sessions p
+              ON p.user_id = t.user_id AND p.workout_id = t.workout_id AND p.session_id < t.session_id
+            WHERE t.session_id = :session_id
+              AND EXISTS (SELECT 1 FROM exercise_entries pe WHERE pe.session_id = p.session_id)
+            ORDER BY p.session_id DESC LIMIT 1
         )
-
-        # Add set to database - exercise_entries
-        # SELECT session_id FROM Sessions WHERE workout_id = my_workout_id ORDER BY session_id DESC
-        if workout_id_from_db is not None:
-            # Check if a session already exists for today
-            does_session_exist = (
-                db.session.query(Sessions.session_id)
-                .filter(
-                    and_(
-                        Sessions.workout_id == workout_id_from_db[0],
-                        Sessions.user_id == user_id,
-                        Sessions.session_date >= today,
-                        Sessions.session_date < tomorrow,
-                    )
-                )
-                .first()
-            )
-            
-            if does_session_exist:
-                print("Sorry, there is already a workout session for today")
-            else:
-                try:
-                    # No session exists for today; create a new one
-                    new_session_query = Sessions(
-                        user_id=user_id, workout_id=workout_id_from_db[0], notes="Null",
-                    )
-                    db.session.add(new_session_query)
-                    db.session.commit()  # Commit here to assign session_id
-                except:
-                    db.session.rollback()
-            session_id_form_db = (
-                db.session.query(Sessions.session_id)
-                .filter(Sessions.workout_id == workout_id_from_db[0])
-                .order_by(desc(Sessions.session_date)).first()
-            )
-
-            if not session_id_form_db:
-                session_id_form_db = (
-                db.session.query(Sessions.session_id)
-                .filter(Sessions.workout_id == chosen_day)
-                .order_by(desc(Sessions.session_date)).first()
-            )
-                
-            if last_exercise_query:
-                try:
-                    add_exercise_entry =  ExerciseEntries(
-                        session_id = session_id_form_db[0],
-                        exercise_id = last_exercise_query.exercise_id,
-                        set_number = sets_yet,
-                        reps = last_exercise_query.reps,
-                        weight= last_exercise_query.weight,
-                        rpe= last_exercise_query.rpe,
-                        notes= ""
-                    )
-
-                    print(f"last_exercise_query.exercise_id: {last_exercise_query.exercise_id}")
-                    db.session.add(add_exercise_entry)
-                    db.session.commit()
-                except Exception as e:
-                    print(f"Error just appeared, I am rolling back: {e}\n erro on line {inspect.currentframe().f_lineno}")
-                    db.session.rollback()                  
+      AND NOT EXISTS (
+            SELECT 1 FROM exercise_entries d WHERE d.session_id = :session_id AND d.exercise_id = e.exercise_id
+        )
+    ORDER BY e.entry_id
+    RETURNING entry_id, session_id, exercise_id, set_number, reps, weight, rpe, notes
+""")
+# New set or None when user never did the exercise
+def repeat_set(session_id, exercise_id):
+    entry = db.session.execute(REPEAT_SET_QUERY, {
+        "session_id": session_id, "exercise_id": exercise_id, "user_id": current_user_id_db(),
+    }).first()
+    return entry
+# Copied sets (empty list when there is nothing to copy)
+def copy_previous_session(session_id) -> list:
+    return db.session.execute(COPY_PREVIOUS_SESSION_QUERY, {"session_id": session_id}).all()
 # Sets for jinja
 def jinja_sets_function(chosen_day, chosen_exercise):
-    user = Users.query.filter_by(username=current_user.username).first()
-    user_id_db = user.user_id
+    user_id_db = current_user_id_db()
 
     if chosen_exercise:
         exercise_id = find_exercise_id_db(chosen_exercise)[0]
@@ -900,49 +1439,17 @@ def jinja_sets_function(chosen_day, chosen_exercise):
         print(f"Exercise '{chosen_exercise}' not found.")
         return None
 
-    workout_id_from_db = (
-    db.session.query(WorkoutPlan.workout_id)
-    .filter(
-        WorkoutPlan.workout_name == chosen_day,
-        WorkoutPlan.user_id == user_id_db
-    )
-    .order_by(desc(WorkoutPlan.created_at))
-    .first()
-    )
+    workout_id_from_db = day_workout_id(chosen_day)
 
     if workout_id_from_db:
-        today = datetime.combine(date.today(), datetime.min.time())
-        tomorrow = today + timedelta(days=1)
-
-        if chosen_day != "c":
-            desired_session = (
-                db.session.query(Sessions.session_id)
-                .filter(
-                    Sessions.user_id == user_id_db,
-                    Sessions.workout_id == workout_id_from_db[0],
-                    Sessions.session_date >= today,
-                    Sessions.session_date < tomorrow,
-                )
-                .first()
-            )
-        else:
-            desired_session = (
-                db.session.query(Sessions.session_id)
-                .filter(
-                    Sessions.user_id == user_id_db,
-                    Sessions.workout_id == "c",
-                    Sessions.session_date >= today,
-                    Sessions.session_date < tomorrow,
-                )
-                .first()
-            )
+        desired_session = get_today_session(workout_id_from_db)
 
         if desired_session:
             try:
                 relevant_exercise_sets = (
                     db.session.query(ExerciseEntries)
                     .filter(
-                        ExerciseEntries.session_id == desired_session[0],
+                        ExerciseEntries.session_id == desired_session,
                         ExerciseEntries.exercise_id == exercise_id,
                     )
                     .all()
@@ -959,179 +1466,59 @@ def jinja_sets_function(chosen_day, chosen_exercise):
     else:
         print("Workout ID not found.")
         return None
+# Only sets from sessions of current user can be deleted / edited
+def user_session_ids():
+    return select(Sessions.session_id).where(Sessions.user_id == current_user_id_db())
 def delete_set(submitted_data):
-    try:
-        # Check if 'delete' key exists and if it contains values
-        if "delete" in submitted_data:
-            # Retrieve the IDs to delete (assuming it's a list of entry IDs)
-            entry_ids_to_delete = (
-                submitted_data.getlist("delete")
-                if isinstance(submitted_data["delete"], list)
-                else [submitted_data["delete"]]
-            )
-
-            # Execute the delete statement using SQLAlchemy
-            stmt = delete(ExerciseEntries).where(
-                ExerciseEntries.entry_id.in_(entry_ids_to_delete)
-            )
-            db.session.execute(stmt)
-            db.session.commit()
-    except KeyError:
-        db.session.rollback()
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error during deletion: {e}")
-def exercise_preview(workout_id, workout_key, chosen_exercise, chosen_day_by_user, workouts_id):
-    user_id_db = current_user_id_db()
-    preview = {"exercise": None,"sets": None, "reps": None, "weight": None, "rpe": None, "notes": None, "done": None}
-    preview_data = []
-
-    today = datetime.combine(date.today(), datetime.min.time())
-    tomorrow = today + timedelta(days=1)
-
-    if workout_id and workout_key is not None:
-        select_all_exercises = (
-            db.session.query(WorkoutExercises)
-            .filter(WorkoutExercises.workout_id == workout_id[workout_key])
-            .all()
+    # Check if 'delete' key exists and if it contains values
+    if "delete" in submitted_data:
+        # Retrieve the IDs to delete (assuming it's a list of entry IDs)
+        entry_ids_to_delete = (
+            submitted_data.getlist("delete")
+            if isinstance(submitted_data["delete"], list)
+            else [submitted_data["delete"]]
         )
 
-        # Find last session ID -> if not, preview will be all none
-        last_session_id = db.session.query(Sessions).filter(Sessions.user_id==user_id_db).order_by(desc(Sessions.session_id)).first()
-        if last_session_id:
-            if select_all_exercises:
-                # Populate dict with exercises
-                for exers in select_all_exercises:
-                    exercise_name = find_exercise_name_db(exers.exercise_id)[0]
-        
-                    # Fetch the latest ExerciseEntries for the current exercise
-                    latest_entry = (
-                        db.session.query(ExerciseEntries)
-                        .filter(ExerciseEntries.exercise_id == exers.exercise_id)
-                        .order_by(desc(ExerciseEntries.entry_id))
-                        .first()
-                    )
-
-                    # Map the chosen day to the actual workout_id
-                    workout_id_hopefully = workouts_id[chosen_day_by_user]
-
-                    # Check if a session already exists for today
-                    try:
-                        today_session = (
-                            db.session.query(Sessions.session_id)
-                            .filter(
-                                and_(
-                                    Sessions.workout_id == workout_id_hopefully,
-                                    Sessions.user_id == user_id_db,
-                                    Sessions.session_date >= today,
-                                    Sessions.session_date < tomorrow,
-                                )
-                            )
-                            .first()[0]
-                        )
-                    except TypeError as e:
-                        db.session.rollback()
-                        today_session = None
-
-                    done = None
-
-                    if latest_entry and today_session:
-                        if latest_entry.session_id != today_session:
-                            """ print(latest_entry.session_id, ' : ', today_session)
-                            print("We are green bro") """
-                            pass
-                        else:
-                            """ print(latest_entry.session_id, ' : ', today_session)
-                            print("We are not green bro") """
-                            done = "yes"
-                    else:
-                        pass
-                    
-                    # Populate the preview entry with data from the latest_entry or default values
-                    preview_entry = {
-                        "exercise": exercise_name,
-                        "sets": exers.prescribed_sets,
-                        "reps": latest_entry.reps if latest_entry and latest_entry.reps is not None else 0,
-                        "weight": latest_entry.weight if latest_entry and latest_entry.weight is not None else 0,
-                        "rpe": latest_entry.rpe if latest_entry and latest_entry.rpe is not None else 0,
-                        "notes": latest_entry.notes if latest_entry and latest_entry.notes else "",
-                        "done" : done
-                    }
-                    
-                    preview_data.append(preview_entry)
-
-                return preview_data
-
-            else:
-
-                return {None : None}
-        else:
-            for exers in select_all_exercises:
-                    exercise_name = find_exercise_name_db(exers.exercise_id)[0]
-
-                    if exercise_name and exers.prescribed_sets:
-                        preview_entry = {
-                            "exercise": exercise_name,
-                            "sets": exers.prescribed_sets,
-                            "reps": 0,
-                            "weight": 0,
-                            "rpe": None,
-                            "notes": None,
-                            "done" : None
-                        }
-                        preview_data.append(preview_entry)
-            return preview_data       
-# Modify sets which user already saved
+        # Execute the delete statement using SQLAlchemy
+        stmt = delete(ExerciseEntries).where(
+            ExerciseEntries.entry_id.in_(entry_ids_to_delete),
+            ExerciseEntries.session_id.in_(user_session_ids()),
+        )
+        db.session.execute(stmt)
+# Modify sets which user already saved - every edited entry in one executemany UPDATE,
+# empty field keeps saved value
+MODIFY_SET_STATEMENT = text("""
+    UPDATE exercise_entries SET
+        reps = coalesce(:reps, reps),
+        weight = coalesce(:weight, weight),
+        rpe = coalesce(:rpe, rpe),
+        notes = coalesce(:notes, notes)
+    WHERE entry_id = :entry_id
+      AND session_id IN (SELECT session_id FROM sessions WHERE user_id = :user_id)
+""")
 def modify_set(submitted_data):
+    changes = {}
     for key, value in submitted_data.items():
-        if key.startswith("update_"):
-            entry_id = key.split("_")[-1]
-
-            reps = submitted_data.get(f"update_reps_{entry_id}", None)
-            weight = submitted_data.get(f"update_weight_{entry_id}", None)
-            rpe = submitted_data.get(f"update_rpe_{entry_id}", None)
-            notes = submitted_data.get(f"update_notes_{entry_id}", None)
-
-            entry = db.session.get(ExerciseEntries, entry_id)
-            if value and entry:    
-                try:
-                    entry.reps = reps if reps else entry.reps
-                    entry.weight = weight if weight else entry.weight
-                    entry.rpe = rpe if rpe else entry.rpe
-                    entry.notes = notes if notes else entry.notes
+        if key.startswith("update_") and value:
+            field, entry_id = key.removeprefix("update_").rsplit("_", 1)
+            changes.setdefault(entry_id, {})[field] = value
 
-                    db.session.commit()
-                except Exception as e:
-                    print(f"Changing your set data failed because of {e}")
-                    db.session.rollback()
-def sets_to_do(chosen_exercise, chosen_day):
-    current_user_id = current_user_id_db()
-    # Exercise id
     try:
-        exercise_id = find_exercise_id_db(chosen_exercise)[0]
-    except Exception as e:
-        exercise_id = None
-        print(f"exercise_id is None probably: {e}")
-
-    if exercise_id:
-        workout_id = db.session.query(WorkoutPlan.workout_id).filter(
-            WorkoutPlan.user_id == current_user_id,
-            WorkoutPlan.workout_name == chosen_day
-        ).order_by(desc(WorkoutPlan.created_at)).first()
-        
-        if workout_id:
-            # Search workout_exercise_id for prescribed sets
-            specific_exercise = db.session.query(WorkoutExercises).filter(
-                WorkoutExercises.workout_id == workout_id[0],
-                WorkoutExercises.exercise_id == exercise_id
-            ).first()
-
-            if specific_exercise:
-                return specific_exercise.prescribed_sets
-            else:
-                return None
+        # Fields left empty stay None -> MODIFY_SET_STATEMENT keeps saved value
+        changes = {
+            entry_id: {**dict.fromkeys(SET_FIELDS), **parse_set_fields(fields, partial=True)}
+            for entry_id, fields in changes.items()
+        }
+    except ValueError as e:
+        flash(f"Sets were not updated: {e}", "danger")
+        return
+
+    if changes:
+        user_id = current_user_id_db()
+        db.session.execute(MODIFY_SET_STATEMENT, [
+            {**values, "entry_id": entry_id, "user_id": user_id} for entry_id, values in changes.items()
+        ])
 def current_exercise_info(chosen_exercise, chosen_day):
-    current_user_id = current_user_id_db()
     # Exercise id
     try:
         exercise_id = find_exercise_id_db(chosen_exercise)[0]
@@ -1140,37 +1527,8 @@ def current_exercise_info(chosen_exercise, chosen_day):
         print(f"exercise_id is None probably: {e}")
 
     if exercise_id:
-        previous_exercise_entry = (
-            db.session.query(ExerciseEntries)
-            .join(Sessions, ExerciseEntries.session_id == Sessions.session_id)
-            .filter(
-                ExerciseEntries.exercise_id == exercise_id,
-                Sessions.user_id == current_user_id,
-            )
-            .order_by(desc(ExerciseEntries.session_id), desc(ExerciseEntries.weight), desc(ExerciseEntries.reps))
-            .first()
-        )
-
-        # Get the heaviest weight for the exercise in the last session
-        # Ensure previous_exercise_entry exists
-        if previous_exercise_entry:
-            # Get the heaviest weight entry for that session and exercise
-            heaviest_weight_entry = (
-                db.session.query(ExerciseEntries)
-                .filter(
-                    ExerciseEntries.exercise_id == previous_exercise_entry.exercise_id,
-                    ExerciseEntries.session_id == previous_exercise_entry.session_id
-                )
-                .order_by(desc(ExerciseEntries.weight))
-                .first()
-            )
-        else:
-            heaviest_weight_entry = None
-
-        if heaviest_weight_entry:
-            return heaviest_weight_entry
-        else:
-            return None
+        # Heaviest set from the last session user did this exercise in
+        return latest_sets([exercise_id]).get(exercise_id, {}).get("heaviest")
 def show_tables_to_user(current_user) -> dict:
     current_user_id = current_user_id_db()
 
@@ -1225,7 +1583,8 @@ def tables_informations(chosen_mesocycle: str, mesocycle_info: dict) -> dict:
                 w_name_to_dict = workout_name_db[0]
                 workout_exercises = db.session.query(WorkoutExercises).filter(
                     WorkoutExercises.workout_id == wid,
-                ).all()
+                    WorkoutExercises.to_version.is_(None),
+                ).order_by(WorkoutExercises.order_in_workout).all()
                 
                 # Initialize a dictionary for this workout
                 exercise_dict = {}
@@ -1274,7 +1633,8 @@ def workout_day_information(chosen_mesocycle: str, mesocycle_info: dict) -> dict
                 w_name_to_dict = workout_name_db[0]
                 workout_exercises = db.session.query(WorkoutExercises).filter(
                     WorkoutExercises.workout_id == wid,
-                ).all()       
+                    WorkoutExercises.to_version.is_(None),
+                ).order_by(WorkoutExercises.order_in_workout).all()       
             
                 #print(f"what do we have here{workout_name_db[0]} - {wid}")
 
@@ -1284,6 +1644,11 @@ def workout_day_information(chosen_mesocycle: str, mesocycle_info: dict) -> dict
                 workouts_from_db[w_name_to_dict] = workouts_list
     
     return workouts_from_db
+# Plan row was part of plan version session was performed against (unknown version -> any row)
+def in_plan_version(row, version) -> bool:
+    if version is None:
+        return True
+    return row.from_version <= version and (row.to_version is None or version < row.to_version)
 # Information about progress prepared for jinja2
 def exercise_progress_data(workout_info, chosen_day, mesocycle_name):
     current_user_id = current_user_id_db()
@@ -1304,13 +1669,6 @@ def exercise_progress_data(workout_info, chosen_day, mesocycle_name):
                     WorkoutPlan.mesocycle_id == mesocycle_id
                 ).order_by(desc(WorkoutPlan.created_at)).first()[0]
 
-                # Find if workout Name == "c" 
-                workout_id_c = db.session.query(WorkoutPlan).filter(
-                    WorkoutPlan.user_id == current_user_id,
-                    WorkoutPlan.workout_name == "c",
-                    WorkoutPlan.mesocycle_id == mesocycle_id
-                ).order_by(desc(WorkoutPlan.created_at)).first()
-
                 # First session exercise_entry
                 if workout_id:
                     try:
@@ -1326,28 +1684,37 @@ def exercise_progress_data(workout_info, chosen_day, mesocycle_name):
                         Sessions.workout_id == workout_id
                     ).all()
 
-                    # Check if these is custom (c) workout
+                    # Check if these is custom workout
                     if not all_sessions:
                         all_sessions = db.session.query(Sessions).filter(
                         Sessions.user_id == current_user_id,
-                        Sessions.workout_id == "c"
+                        Sessions.kind == WorkoutKind.CUSTOM
                     ).all()
                         
 
-                    exercises_in_workout = db.session.query(WorkoutExercises).filter(
+                    # Every version of the day's rows - exercise replaced by plan edit keeps the
+                    # sessions done while it was in the plan, current exercise only shows its own
+                    day_rows = db.session.query(WorkoutExercises).filter(
                                 WorkoutExercises.workout_id == workout_id
-                            ).all()
-                    
+                            ).order_by(WorkoutExercises.order_in_workout, WorkoutExercises.from_version).all()
+                    exercises_in_workout = {}
+                    for row in day_rows:
+                        exercises_in_workout.setdefault(row.exercise_id, []).append(row)
 
                     if exercises_in_workout:
-                        for exrs in exercises_in_workout:
-                            exercise_name = find_exercise_name_db(exrs.exercise_id)[0]
+                        for exercise_id, rows in exercises_in_workout.items():
+                            exercise_name = find_exercise_name_db(exercise_id)[0]
                             small_data_list = []
 
                             for sess in all_sessions:
+                                # Custom sessions (fallback above) belong to other workouts
+                                if sess.workout_id == workout_id and not any(
+                                    in_plan_version(row, sess.plan_version) for row in rows
+                                ):
+                                    continue
                                 find_exe = db.session.query(ExerciseEntries).filter(
                                     ExerciseEntries.session_id == sess.session_id,
-                                    ExerciseEntries.exercise_id == exrs.exercise_id
+                                    ExerciseEntries.exercise_id == exercise_id
                                 ).all()
 
                                 for som in find_exe:
@@ -1369,14 +1736,10 @@ def exercise_progress_data(workout_info, chosen_day, mesocycle_name):
         return {None:None}
 # AJAX for exercises preview when creating workout
 def fetch_exercise_suggestions(search_term):
-    exercises = Exercise.query.filter(
-        Exercise.exercise_name.ilike(f"%{search_term}%")
-    ).all()
-    return [exercise.exercise_name for exercise in exercises]
+    return suggest_exercises(search_term)
 def get_today_intuitive_traing():
     current_user_id = current_user_id_db()
-    today = datetime.combine(date.today(), datetime.min.time())
-    tomorrow = today + timedelta(days=1)
+    today, tomorrow = user_day_bounds()
 
     today_check_query = (
             db.session.query(WorkoutPlan)
@@ -1385,7 +1748,7 @@ def get_today_intuitive_traing():
                     WorkoutPlan.user_id == current_user_id,
                     WorkoutPlan.created_at >= today,
                     WorkoutPlan.created_at < tomorrow,
-                    WorkoutPlan.workout_name.like("%_intuitive")
+                    WorkoutPlan.kind == WorkoutKind.INTUITIVE
                 )
             )
             .order_by(desc(WorkoutPlan.created_at))
@@ -1396,15 +1759,20 @@ def get_today_intuitive_traing():
         return name
     else:
         return None
+# Position after the last exercise of the day (count() repeated numbers once something was deleted)
+def next_order_in_workout(workout_id):
+    return db.session.scalar(
+        select(func.coalesce(func.max(WorkoutExercises.order_in_workout), 0) + 1)
+        .where(WorkoutExercises.workout_id == workout_id)
+    )
 # Add exercise into workout_exercises 
 def create_custom_workout_exercise(exercise_name):
     user_id_db = current_user_id_db()
-    today = datetime.combine(date.today(), datetime.min.time())
-    tomorrow = today + timedelta(days=1)
+    today, tomorrow = user_day_bounds()
     # Find exercise_id for exercise user have inputed
-    exe_id = (
-        db.session.query(Exercise).filter_by(exercise_name=exercise_name).first()
-    )
+    exe_id = find_exercise_id_db(exercise_name)
+    if not exe_id:
+        return False
 
     # Find workout id and order in workout
     workout_id_query =  (
@@ -1414,7 +1782,7 @@ def create_custom_workout_exercise(exercise_name):
                     WorkoutPlan.user_id == user_id_db,
                     WorkoutPlan.created_at >= today,
                     WorkoutPlan.created_at < tomorrow,
-                    WorkoutPlan.workout_name == "c"
+                    WorkoutPlan.kind == WorkoutKind.CUSTOM
                 )
             )
             .order_by(desc(WorkoutPlan.created_at))
@@ -1425,16 +1793,12 @@ def create_custom_workout_exercise(exercise_name):
         # Check if exercise is in WorkoutExercises table
         exercise_already_in_table = (db.session.query(WorkoutExercises)
                                     .filter(WorkoutExercises.workout_id == workout_id_query.workout_id,
-                                            WorkoutExercises.exercise_id == exe_id.exercise_id)
+                                            WorkoutExercises.exercise_id == exe_id[0])
                                     .first())
         if exercise_already_in_table is None:
-                order = (db.session.query(WorkoutExercises)
-                        .filter(WorkoutExercises.workout_id == workout_id_query.workout_id)
-                        .count())
-                if order == 0:
-                    order = 1
+                order = next_order_in_workout(workout_id_query.workout_id)
 
-                new_workout_exercise = WorkoutExercises(workout_id=workout_id_query.workout_id, exercise_id=exe_id.exercise_id, order_in_workout=order, prescribed_sets=2, rest_period=120)
+                new_workout_exercise = WorkoutExercises(workout_id=workout_id_query.workout_id, exercise_id=exe_id[0], order_in_workout=order, prescribed_sets=2, rest_period=120)
 
                 try:
                     db.session.add(new_workout_exercise)
@@ -1442,7 +1806,7 @@ def create_custom_workout_exercise(exercise_name):
 
                     added_exercise = (db.session.query(WorkoutExercises)
                                         .filter(WorkoutExercises.workout_id == workout_id_query.workout_id,
-                                                WorkoutExercises.exercise_id == exe_id.exercise_id)
+                                                WorkoutExercises.exercise_id == exe_id[0])
                                         .first())
                     
                     return True
@@ -1454,15 +1818,12 @@ def add_intuitive_exercise(exercise):
     user_id_db = current_user_id_db()
 
     # Check if there is exercise in database
-    exercise_in_db = (db.session.query(Exercise)
-                      .filter(Exercise.exercise_name == exercise)
-                      .first())
+    exercise_in_db = find_exercise_id_db(exercise)
 
 
     if exercise_in_db:
         # Create new session
-        today = datetime.combine(date.today(), datetime.min.time())
-        tomorrow = today + timedelta(days=1)
+        today, tomorrow = user_day_bounds()
         workout_id_query = (
             db.session.query(WorkoutPlan)
             .filter(
@@ -1470,7 +1831,7 @@ def add_intuitive_exercise(exercise):
                     WorkoutPlan.user_id == user_id_db,
                     WorkoutPlan.created_at >= today,
                     WorkoutPlan.created_at < tomorrow,
-                    WorkoutPlan.workout_name.like("%_intuitive")
+                    WorkoutPlan.kind == WorkoutKind.INTUITIVE
                 )
             )
             .order_by(desc(WorkoutPlan.created_at))
@@ -1481,17 +1842,13 @@ def add_intuitive_exercise(exercise):
             # Check if exercise is in WorkoutExercises table
             exercise_already_in_table = (db.session.query(WorkoutExercises)
                                         .filter(WorkoutExercises.workout_id == workout_id_query.workout_id,
-                                                WorkoutExercises.exercise_id == exercise_in_db.exercise_id)
+                                                WorkoutExercises.exercise_id == exercise_in_db[0])
                                         .first())
 
             if exercise_already_in_table is None:
-                order = (db.session.query(WorkoutExercises)
-                        .filter(WorkoutExercises.workout_id == workout_id_query.workout_id)
-                        .count())
-                if order == 0:
-                    order = 1
+                order = next_order_in_workout(workout_id_query.workout_id)
 
-                new_workout_exercise = WorkoutExercises(workout_id=workout_id_query.workout_id, exercise_id=exercise_in_db.exercise_id, order_in_workout=order, prescribed_sets=2, rest_period=90)
+                new_workout_exercise = WorkoutExercises(workout_id=workout_id_query.workout_id, exercise_id=exercise_in_db[0], order_in_workout=order, prescribed_sets=2, rest_period=90)
 
                 try:
                     db.session.add(new_workout_exercise)
@@ -1499,7 +1856,7 @@ def add_intuitive_exercise(exercise):
 
                     added_exercise = (db.session.query(WorkoutExercises)
                                         .filter(WorkoutExercises.workout_id == workout_id_query.workout_id,
-                                                WorkoutExercises.exercise_id == exercise_in_db.exercise_id)
+                                                WorkoutExercises.exercise_id == exercise_in_db[0])
                                         .first())
                     
                     return find_exercise_name_db(added_exercise.exercise_id)[0]
@@ -1516,41 +1873,16 @@ def add_intuitive_exercise(exercise):
         return None
 # Custom workout - check if current day exists
 def check_c_session():
-    user = Users.query.filter_by(username=current_user.username).first()
-    user_id_db = user.user_id
-
-    # Help function to determine current day - sessions are valid only for that day
-    today = datetime.combine(date.today(), datetime.min.time())
-    tomorrow = today + timedelta(days=1)
-
-    # Check if a session already exists for today
-    does_session_exist = (
-        db.session.query(Sessions.session_id)
-        .filter(
-            and_(
-                Sessions.workout_id == "c",
-                Sessions.user_id == user_id_db,
-                Sessions.session_date >= today,
-                Sessions.session_date < tomorrow,
-            )
-        )
-        .first()
-    )
-
-    if does_session_exist:
-        return True
-    else:
-        return False
+    # Sessions are valid only for user's current day
+    workout_id = day_workout_id(WorkoutKind.CUSTOM)
+    return workout_id is not None and get_today_session(workout_id) is not None
 def create_custom_session():
-    user = Users.query.filter_by(username=current_user.username).first()
-    user_id_db = user.user_id
-
-    today = datetime.combine(date.today(), datetime.min.time())
-    tomorrow = today + timedelta(days=1)
+    user_id_db = current_user_id_db()
 
-    # Create custom session - 'c' for simple search in DB
+    # Custom session belongs to today's custom workout
     new_session_query = Sessions(
-            user_id=user_id_db, workout_id="c", notes="Null",
+            user_id=user_id_db, workout_id=day_workout_id(WorkoutKind.CUSTOM), notes="Null",
+            kind=WorkoutKind.CUSTOM,
         )
     db.session.add(new_session_query)
     db.session.commit()
@@ -1569,19 +1901,12 @@ def create_custom_session():
     )
 
     # Find mmesocycle ID to assign my current session to - I want it to be assigned to user's last mesoc
-    mesocycle_id_query = (
-        db.session.query(Mesocycles.mesocycle_id)
-        .filter(
-            Mesocycles.user_id == user_id_db,
-        )
-        .order_by(desc(Mesocycles.mesocycle_id))
-        .first()
-    )
+    last_meso = latest_mesocycle()
 
-    if session_id_result is not None and mesocycle_id_query is not None:
+    if session_id_result is not None and last_meso is not None:
         new_session_mesocycles_query = SessionMesocycles(
             session_id=session_id_result,
-            mesocycle_id=mesocycle_id_query[0],
+            mesocycle_id=last_meso["mesocycle_id"],
             training_day_number=training_day_number_query,
         )
         db.session.add(new_session_mesocycles_query)
@@ -1589,33 +1914,25 @@ def create_custom_session():
 # Insert custom exercise into workout_exercises
 def create_custom_workout_plan():
     # If there is no custom workout for today, just make it happen
-    user = Users.query.filter_by(username=current_user.username).first()
-    user_id_db = user.user_id
+    user_id_db = current_user_id_db()
 
-    today = datetime.combine(date.today(), datetime.min.time())
-    tomorrow = today + timedelta(days=1)
+    today, tomorrow = user_day_bounds()
 
-    mesocycle_id_query = (
-        db.session.query(Mesocycles.mesocycle_id)
-        .filter(
-            Mesocycles.user_id == user_id_db,
-        )
-        .order_by(desc(Mesocycles.mesocycle_id))
-        .first()
-    )
+    last_meso = latest_mesocycle()
 
     today_workout = db.session.query(WorkoutPlan).filter(
         WorkoutPlan.user_id == user_id_db,
         WorkoutPlan.created_at >= today,
         WorkoutPlan.created_at < tomorrow,
-        WorkoutPlan.workout_name == "c",
+        WorkoutPlan.kind == WorkoutKind.CUSTOM,
     ).first()
     
     if not today_workout:
         create_custom_workout_day = WorkoutPlan(
             user_id=user_id_db,
-            workout_name="c",
-            mesocycle_id=mesocycle_id_query[0],
+            workout_name="Custom",
+            mesocycle_id=last_meso["mesocycle_id"],
+            kind=WorkoutKind.CUSTOM,
         )
         try:
             db.session.add(create_custom_workout_day)
@@ -1629,10 +1946,8 @@ def create_custom_workout_plan():
         return False
 # Load into list all custom exercises for this day        
 def load_custom_exercises_for_day():
-    user = Users.query.filter_by(username=current_user.username).first()
-    user_id_db = user.user_id
-    today = datetime.combine(date.today(), datetime.min.time())
-    tomorrow = today + timedelta(days=1)
+    user_id_db = current_user_id_db()
+    today, tomorrow = user_day_bounds()
 
     result = []
 
@@ -1640,13 +1955,13 @@ def load_custom_exercises_for_day():
         WorkoutPlan.user_id == user_id_db,
         WorkoutPlan.created_at >= today,
         WorkoutPlan.created_at < tomorrow,
-        WorkoutPlan.workout_name == "c",
+        WorkoutPlan.kind == WorkoutKind.CUSTOM,
     ).first()
 
     if today_workout:
         find_saved_exercises_query = db.session.query(WorkoutExercises).filter(
             WorkoutExercises.workout_id == today_workout.workout_id
-        ).all()
+        ).order_by(WorkoutExercises.order_in_workout).all()
 
         for x in find_saved_exercises_query:
             result.append(find_exercise_name_db(x.exercise_id)[0])
@@ -1710,8 +2025,7 @@ def exercises_progress(exercises_data):
     return data
 # Filter data for graph to create
 def data_for_graph():
-    user = Users.query.filter_by(username=current_user.username).first()
-    user_id_db = user.user_id
+    user_id_db = current_user_id_db()
     session_for_user = []
 
     all_sessions_query = db.session.query(Sessions).filter(
@@ -1804,8 +2118,7 @@ def all_exercises_list():
         return None
 # Load last 3 sets for chosen exercise
 def last_custom_day(exercise):
-    user = Users.query.filter_by(username=current_user.username).first()
-    user_id_db = user.user_id
+    user_id_db = current_user_id_db()
     exercise_id = find_exercise_id_db(exercise)[0]
     # SELECT last workout FROM  WorkoutPlan
     last_c_work_query = db.session.query(WorkoutPlan).filter(
@@ -1975,80 +2288,216 @@ def workout_to_excel(data):
     return output # Return the BytesIO object containing the Excel file data
 # Function created for progress page -> set default mesocycle for user's last one in db
 def last_mesocycle_by_default() -> str:
-    user_id = current_user_id_db()
-    last_meso_query = db.session.query(Mesocycles).filter(Mesocycles.user_id == user_id).order_by(desc(Mesocycles.mesocycle_id)).first()
-    return last_meso_query.name
-def user_last_session_id(workout_id, chosen_day):
-    # I need to include workout id
-    current_workout_query = db.session.query(WorkoutPlan).filter(
-                                                                 WorkoutPlan.workout_name == chosen_day
-                                                                 ).all()
-    
-    workout_id_current = None
-    if current_workout_query:
-        for x in current_workout_query:
-            for y in workout_id:
-                if x.workout_id == y:
-                    workout_id_current = x
-                    break
-
-    user_id = current_user_id_db()
-    if not workout_id_current:
-        return None, None 
-
-    return db.session.query(Sessions).filter(Sessions.user_id == user_id, Sessions.workout_id == workout_id_current.workout_id).order_by(desc(Sessions.session_id)).all(), workout_id_current.workout_id
-# Training session: Button "Preview" -> only current mesocycle :)
-def last_exercise_preview(chosen_exercise, workout_id, chosen_day):
-    user_id = current_user_id_db()
-    today = datetime.combine(date.today(), datetime.min.time())
-    tomorrow = today + timedelta(days=1)
-    if not chosen_exercise:
-        return None
-    
-    # If today's session -> just written in -> go to previous session
-    day_check = (
-        db.session.query(Sessions.session_id)
-        .filter(
-            and_(
-                Sessions.user_id == user_id,
-                Sessions.session_date >= today,
-                Sessions.session_date < tomorrow,
-            )
-        )
-        .first()
+    return latest_mesocycle()["name"]
+# Latest and heaviest set per exercise -----------------------------------------
+# For every exercise in :exercise_ids: the user's last session with it (walks
+# ix_exercise_entries_exercise_session backwards until first session of this user -
+# CROSS JOIN keeps entries as outer loop), then ROW_NUMBER ranks sets of that session
+LATEST_SETS_CTE = """
+    last_sessions AS (
+        SELECT x.exercise_id, (
+            SELECT e.session_id FROM exercise_entries e CROSS JOIN sessions s ON s.session_id = e.session_id
+            WHERE e.exercise_id = x.exercise_id AND s.user_id = :user_id
+            ORDER BY e.session_id DESC LIMIT 1
+        ) AS session_id
+        FROM exercises x WHERE x.exercise_id IN :exercise_ids
+    ),
+    ranked_sets AS (
+        SELECT e.entry_id, e.session_id, e.exercise_id, e.set_number, e.reps, e.weight, e.rpe, e.notes,
+               ROW_NUMBER() OVER (PARTITION BY e.exercise_id ORDER BY e.entry_id DESC) AS latest_rank,
+               ROW_NUMBER() OVER (PARTITION BY e.exercise_id ORDER BY e.weight DESC, e.reps DESC) AS heaviest_rank
+        FROM last_sessions JOIN exercise_entries e
+          ON e.session_id = last_sessions.session_id AND e.exercise_id = last_sessions.exercise_id
     )
+"""
+LATEST_SETS_QUERY = text(f"""
+    WITH {LATEST_SETS_CTE}
+    SELECT * FROM ranked_sets WHERE latest_rank = 1 OR heaviest_rank = 1
+""").bindparams(bindparam("exercise_ids", expanding=True))
+# {exercise_id: {"latest": row, "heaviest": row}} for exercises current user has ever done
+def latest_sets(exercise_ids) -> dict:
+    result = {}
+    rows = db.session.execute(LATEST_SETS_QUERY, {
+        "user_id": current_user_id_db(),
+        "exercise_ids": list(exercise_ids),
+    })
+    for row in rows:
+        sets = result.setdefault(row.exercise_id, {})
+        if row.latest_rank == 1:
+            sets["latest"] = row
+        if row.heaviest_rank == 1:
+            sets["heaviest"] = row
+    return result
+# Training session view model ------------------------------------------------
+# Everything training_session.html shows besides the plan (plan comes from plan cache):
+# today's sets, placeholders, previous session sets and preview of the day - in one statement.
+# Every part is tagged in "part" column so rows can be dealt out in Python
+TRAINING_SESSION_VIEW_QUERY = text(f"""
+    WITH today_session AS (
+        SELECT session_id FROM sessions
+        WHERE user_id = :user_id AND workout_id = :workout_id AND training_day = :today
+        ORDER BY session_id DESC LIMIT 1
+    ),
+    -- N-th previous session of the workout (OFFSET = N - 1), read in
+    -- ix_sessions_user_workout_date order - no sort
+    previous_session AS (
+        SELECT session_id FROM sessions
+        WHERE user_id = :user_id AND workout_id = :workout_id
+          AND session_id NOT IN (SELECT session_id FROM today_session)
+        ORDER BY session_date DESC LIMIT 1 OFFSET :previous_offset
+    ),
+    -- Session after it -> "Older" link is shown only when there is somewhere to go
+    older_session AS (
+        SELECT session_id FROM sessions
+        WHERE user_id = :user_id AND workout_id = :workout_id
+          AND session_id NOT IN (SELECT session_id FROM today_session)
+        ORDER BY session_date DESC LIMIT 1 OFFSET :previous_offset + 1
+    ),
+    {LATEST_SETS_CTE}
+    SELECT 'today_session' AS part, NULL AS entry_id, session_id, NULL AS exercise_id,
+           NULL AS set_number, NULL AS reps, NULL AS weight, NULL AS rpe, NULL AS notes
+    FROM today_session
+    UNION ALL
+    SELECT 'older', NULL, session_id, NULL, NULL, NULL, NULL, NULL, NULL
+    FROM older_session
+    UNION ALL
+    SELECT 'latest', entry_id, session_id, exercise_id, set_number, reps, weight, rpe, notes
+    FROM ranked_sets WHERE latest_rank = 1
+    UNION ALL
+    -- Heaviest set of the last session with chosen exercise -> placeholders for next set
+    SELECT 'heaviest', entry_id, session_id, exercise_id, set_number, reps, weight, rpe, notes
+    FROM ranked_sets WHERE heaviest_rank = 1 AND exercise_id = :exercise_id
+    UNION ALL
+    SELECT 'today', e.entry_id, e.session_id, e.exercise_id, e.set_number, e.reps, e.weight, e.rpe, e.notes
+    FROM exercise_entries e
+    WHERE e.session_id IN (SELECT session_id FROM today_session) AND e.exercise_id = :exercise_id
+    UNION ALL
+    SELECT 'previous', e.entry_id, e.session_id, e.exercise_id, e.set_number, e.reps, e.weight, e.rpe, e.notes
+    FROM exercise_entries e
+    WHERE e.session_id IN (SELECT session_id FROM previous_session) AND e.exercise_id = :exercise_id
+    ORDER BY entry_id
+""").bindparams(bindparam("exercise_ids", expanding=True))
+# previous=1 -> last session of the workout, 2 -> the one before it, ...
+def load_training_session_view(workout_id, day_exercises, chosen_exercise, previous=1) -> dict:
+    catalog = get_exercise_catalog()
+    exercise_id = catalog["by_name"].get(chosen_exercise)
+    day_exercise_ids = [catalog["by_name"].get(x["exercise"][0]) for x in day_exercises]
+    exercise_ids = {x for x in day_exercise_ids + [exercise_id] if x is not None}
+
+    parts = {"today_session": [], "older": [], "latest": [], "today": [], "previous": [], "heaviest": []}
+    rows = db.session.execute(TRAINING_SESSION_VIEW_QUERY, {
+        "user_id": current_user_id_db(),
+        "workout_id": workout_id,
+        "today": user_today(),
+        "exercise_id": exercise_id,
+        "exercise_ids": list(exercise_ids),
+        "previous_offset": previous - 1,
+    })
+    for row in rows:
+        parts[row.part].append(row)
+
+    today_session = parts["today_session"][0].session_id if parts["today_session"] else None
+    latest = {row.exercise_id: row for row in parts["latest"]}
+
+    # Day preview - last numbers of every exercise, "done" once it was exercised today
+    preview = []
+    for exercise, exercise_id_in_day in zip(day_exercises, day_exercise_ids):
+        latest_entry = latest.get(exercise_id_in_day)
+        preview.append({
+            "exercise": exercise["exercise"][0],
+            "sets": exercise["sets"],
+            "reps": latest_entry.reps if latest_entry and latest_entry.reps is not None else 0,
+            "weight": latest_entry.weight if latest_entry and latest_entry.weight is not None else 0,
+            "rpe": latest_entry.rpe if latest_entry and latest_entry.rpe is not None else 0,
+            "notes": latest_entry.notes if latest_entry and latest_entry.notes else "",
+            "done": "yes" if latest_entry and today_session and latest_entry.session_id == today_session else None,
+        })
 
-    exe_id = find_exercise_id_db(chosen_exercise)[0]
-
-    if workout_id and chosen_day:
-        last_session, workout_id_current = user_last_session_id(workout_id, chosen_day)
-
-        if last_session:
-            # Try to find exercise with corresponding session_id
-            try:
-                # If there is no session for today
-                if not day_check:
-                    exercise_query = db.session.query(ExerciseEntries).filter(
-                        ExerciseEntries.exercise_id == exe_id,
-                        ExerciseEntries.session_id == last_session[0].session_id
-                        ).all()
-                # If there is session for today
-                else:
-                    # Find previous session
-                    last_session = db.session.query(Sessions).filter(Sessions.user_id == user_id, Sessions.workout_id == workout_id_current).order_by(desc(Sessions.session_id)).all()
-                    exercise_query = db.session.query(ExerciseEntries).filter(
-                    ExerciseEntries.exercise_id == exe_id,
-                    ExerciseEntries.session_id == last_session[1].session_id
-                    ).all()
-
-                if not exercise_query:
-                    return None
-                else:
-                    return exercise_query
-            except:
-                print(f"sorry, no exercise query for you")
-        else:
-            return None
+    sets = parts["today"] or None
+    # Reset placeholders to zero after the first set is saved
+    if sets:
+        placeholders = {'weight': 0, 'reps': 0, 'rpe': 0, 'notes': '...'}
+    else:
+        placeholders = parts["heaviest"][0] if parts["heaviest"] else None
+
+    return {
+        "today_session": today_session,
+        "sets_for_jinja": sets,
+        "placeholders": placeholders,
+        "preview": preview,
+        # Empty past the oldest session (previous=N from old link or typed by hand)
+        "last_exercise": parts["previous"],
+        "previous": previous,
+        "older": bool(parts["older"]),
+    }
+# Exercise history -------------------------------------------------------------
+# Past sessions with one exercise, newest first, page by page. Cursor is session_id of the
+# last session on the page, next page seeks below it in ix_exercise_entries_exercise_session
+# (keyset) instead of OFFSET skipping through whole history
+HISTORY_PAGE_SIZE = 10
+EXERCISE_HISTORY_QUERY = text("""
+    WITH page AS (
+        SELECT DISTINCT e.session_id
+        FROM exercise_entries e CROSS JOIN sessions s ON s.session_id = e.session_id
+        WHERE e.exercise_id = :exercise_id AND s.user_id = :user_id AND e.session_id < :before
+        ORDER BY e.session_id DESC LIMIT :limit
+    )
+    SELECT s.session_id, s.training_day, w.workout_name, e.set_number, e.reps, e.weight, e.rpe, e.notes
+    FROM page
+    JOIN sessions s ON s.session_id = page.session_id
+    LEFT JOIN workouts w ON w.workout_id = s.workout_id
+    JOIN exercise_entries e ON e.session_id = page.session_id AND e.exercise_id = :exercise_id
+    ORDER BY s.session_id DESC, e.set_number
+""")
+def exercise_history(exercise_id, before=None, page_size=HISTORY_PAGE_SIZE) -> dict:
+    rows = db.session.execute(EXERCISE_HISTORY_QUERY, {
+        "user_id": current_user_id_db(),
+        "exercise_id": exercise_id,
+        "before": before if before is not None else 2**63 - 1,
+        "limit": page_size + 1,  # one more session tells if there is older page
+    })
+
+    sessions = OrderedDict()
+    for row in rows:
+        session_row = sessions.setdefault(row.session_id, {
+            "session_id": row.session_id,
+            "training_day": date.fromisoformat(row.training_day) if row.training_day else None,
+            "workout_name": row.workout_name,
+            "sets": [],
+        })
+        session_row["sets"].append(row)
+
+    page = list(sessions.values())[:page_size]
+    has_older = len(sessions) > page_size
+    return {"sessions": page, "next_cursor": page[-1]["session_id"] if has_older else None}
+# JSON set API ---------------------------------------------------------------
+# Confirm / repeat / edit / delete on training_session page without full form POST and
+# re-render: every response carries only rows which changed
+def set_to_json(entry) -> dict:
+    return {
+        "entry_id": entry.entry_id,
+        "session_id": entry.session_id,
+        "exercise": find_exercise_name_db(entry.exercise_id)[0],
+        "set_number": entry.set_number,
+        "reps": entry.reps,
+        "weight": entry.weight,
+        "rpe": entry.rpe,
+        "notes": entry.notes,
+    }
+# Session of current user or None (someone else's session looks same as missing one)
+def owned_session(session_id):
+    session_row = db.session.get(Sessions, session_id)
+    if session_row is None or session_row.user_id != current_user_id_db():
+        return None
+    return session_row
+# Idempotency key generated by client (UUID), None when client didn't send one
+def parse_client_key(data):
+    key = data.get("key")
+    if key is None:
+        return None
+    if not isinstance(key, str) or not 0 < len(key) <= 36:
+        raise ValueError("'key' must be string of 1-36 characters")
+    return key
 
 # --------------------------------------------------------------------
 @app.route("/register", methods=["GET", "POST"])
@@ -2186,49 +2635,53 @@ def table_layout():
         meso_name = request.form.get("meso_name")
         meso_duration = request.form.get("mesocycle")
         workouts_per_week = request.form.get("per_week")
+        # "" (empty days), "mesocycle_<id>" (clone) or "template_<id>"
+        start_from = request.form.get("start_from", "")
 
-        try:
-            mesocycles_db = Mesocycles(
-                name=meso_name,
-                user_id=user_id,
-                mesocycle_duration_weeks=meso_duration,
-                workouts_per_week=workouts_per_week,
-            )
+        source_id = form_int(start_from.partition("_")[2], None)
 
-            db.session.add(mesocycles_db)
+        try:
+            if start_from.startswith("mesocycle_"):
+                mesocycle_id = clone_mesocycle(source_id, meso_name, form_int(meso_duration, None))
+            elif start_from.startswith("template_"):
+                mesocycle_id = instantiate_plan_template(source_id, meso_name, form_int(meso_duration, None))
+            else:
+                mesocycle_id = new_mesocycle(meso_name, meso_duration, workouts_per_week).mesocycle_id
+                # Create rows in WorkoutPlan / workouts based on workout_per_week ... Workout name default to number of the day
+                db.session.execute(insert(WorkoutPlan), [
+                    {"workout_name": i, "user_id": user_id, "mesocycle_id": mesocycle_id}
+                    for i in range(int(workouts_per_week))
+                ])
+            if mesocycle_id is None:
+                db.session.rollback()
+                return redirect(url_for("table_layout"))
             db.session.commit()
-
-            # Find this mesocycle in db
-            mesocycle_id = db.session.query(Mesocycles.mesocycle_id).filter(
-                Mesocycles.user_id == user_id
-            ).order_by(desc(Mesocycles.mesocycle_id)).first()
-
-            if mesocycle_id:
-                # Create rows in WorkoutPlan / workouts based on workout_per_week ... Workout name default to number of weeks
-                # INSERT INTO workouts (user_id, workout_name) VALUES (CurrentUser.username, meso_name)
-                for i in range(int(workouts_per_week)):
-                    user = Users.query.filter_by(username=current_user.username).first()
-                    user_id_db = user.user_id
-
-                    # For OOP this have to go away into reausable function
-                    table = WorkoutPlan(
-                        workout_name=i,
-                        user_id=user_id_db,
-                        mesocycle_id=mesocycle_id[0]
-                    )
-                    db.session.add(table)
-                db.session.commit()
             return redirect(url_for("create_workout"))
         except:
             db.session.rollback()
             return redirect(url_for("home"))
-            
-    return render_template("table_layout.html", year=YEAR)
+
+    mesocycles = db.session.execute(
+        select(Mesocycles.mesocycle_id, Mesocycles.name)
+        .where(Mesocycles.user_id == user_id)
+        .order_by(Mesocycles.mesocycle_id.desc())
+    ).all()
+    templates = db.session.execute(
+        select(PlanTemplates.template_id, PlanTemplates.name)
+        .where(PlanTemplates.user_id == user_id)
+        .order_by(PlanTemplates.template_id.desc())
+    ).all()
+    return render_template("table_layout.html", year=YEAR, mesocycles=mesocycles, templates=templates)
 
 # Here is created mesocycle workout
 @app.route("/create_workout", methods=["GET", "POST"])
 @login_required
 def create_workout():
+    # Old AJAX autocomplete URL, answer it before loading whole plan
+    search_term = request.args.get("query")
+    if request.method == "GET" and search_term:
+        return jsonify(fetch_exercise_suggestions(search_term))
+
     weekly, workout_names, workouts_id = find_users_weeks()
 
     if weekly is None and workout_names is None and workouts_id is None:
@@ -2239,40 +2692,117 @@ def create_workout():
 
     exercises_for_jinja(jinja_exercises, weekly, workouts_id)
 
-    if request.method == "GET":
-        # Handle AJAX request for exercise search
-        search_term = request.args.get("query")
-
-        if search_term:
-            exercise_names = fetch_exercise_suggestions(search_term)
-            return jsonify(exercise_names)
-
-    elif request.method == "POST":
+    status = 200
+    if request.method == "POST":
         # Process form submission and save the workout data
         submitted_data = request.form.to_dict()
-
-        # Name of workout is default set 1-x and user can change it
-        workout_names = find_workout_name_from_user(submitted_data, weekly, workout_names)
-
-        # Save new exercise into database - return order number
-        exercises_dict = add_exercise(submitted_data, order, weekly, jinja_exercises, workouts_id)
-
-        # Call function to delete exercise from workout
-        delete_exercise(submitted_data, weekly, workouts_id)
-
-        # Call function to overwrite exercise
-        overwrite_exercise(submitted_data, weekly, workouts_id, jinja_exercises)
+        diff = plan_diff(submitted_data, weekly, workout_names, workouts_id)
+
+        # Renames, changed / removed / new exercises - applied together in one transaction.
+        # Field names are row positions in the plan form was rendered from, so diff is applied only
+        # when plan is still at that version (same check as PATCH /api/plan)
+        saved = True
+        if any(diff.values()):
+            version = request.form.get("plan_version", type=int)
+            with unit_of_work():
+                new_version = claim_plan_version(expected=version) if version is not None else None
+                if new_version is not None:
+                    apply_plan_diff(diff, new_version)
+            saved = new_version is not None
 
         # Use the PRG pattern: Redirect to prevent resubmission
-        return redirect(url_for("create_workout"))
+        if saved:
+            return redirect(url_for("create_workout"))
+        flash("Plan was changed meanwhile (another tab?) - nothing was saved, this is the current plan.", "warning")
+        status = 409
 
     return render_template(
         "create_workout.html",
         week=weekly,
         w_names=workout_names,
+        w_ids=workouts_id,
         exe_order=order,
         user_exe=jinja_exercises,
-    )
+        plan_version=current_user.plan_version,
+    ), status
+
+# Current plan (latest mesocycle) saved as template - table_layout can start new mesocycle from it
+@app.route("/save_plan_template", methods=["POST"])
+@login_required
+def save_plan_template_page():
+    last_meso = latest_mesocycle()
+    template_name = request.form.get("template_name", "").strip()[:100]
+    if last_meso is not None:
+        with unit_of_work():
+            save_plan_template(last_meso["mesocycle_id"], template_name or last_meso["name"])
+    return redirect(url_for("create_workout"))
+
+# Plan API (JSON) ------------------------------------------------------------
+@app.route("/api/plan", methods=["GET"])
+@login_required
+def api_get_plan():
+    plan = load_active_plan()
+    if plan is None:
+        return jsonify({"error": "no plan yet"}), 404
+    return jsonify(plan_to_json(plan))
+
+# {"version": <plan version the edit is based on>, "operations": [...]}
+# -> {"version": <new version>, "days": [days touched by operations]}
+@app.route("/api/plan", methods=["PATCH"])
+@login_required
+def api_patch_plan():
+    plan = load_active_plan()
+    if plan is None:
+        return jsonify({"error": "no plan yet"}), 404
+    data = request.get_json(silent=True) or {}
+    version = data.get("version")
+    operations = data.get("operations")
+    if isinstance(version, bool) or not isinstance(version, int):
+        return jsonify({"error": "'version' must be int"}), 400
+    if not isinstance(operations, list) or not 0 < len(operations) <= MAX_PLAN_OPERATIONS:
+        return jsonify({"error": f"'operations' must be list of 1-{MAX_PLAN_OPERATIONS} operations"}), 400
+
+    try:
+        diff, touched = plan_operations_diff(operations, plan)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Operations which leave plan as it is don't move version - edits other clients base on it stay valid
+    if not any(diff.values()):
+        return jsonify({"version": current_user.plan_version, "days": plan_days_to_json(touched)})
+
+    # Optimistic concurrency - first write of the transaction moves version only if nobody
+    # changed the plan since client loaded it
+    new_version = claim_plan_version(expected=version)
+    if new_version is None:
+        db.session.rollback()
+        current_version = db.session.scalar(select(Users.plan_version).where(Users.user_id == current_user_id_db()))
+        return jsonify({"error": "plan was changed meanwhile", "version": current_version}), 409
+
+    apply_plan_diff(diff, new_version)
+    days = plan_days_to_json(touched)
+    db.session.commit()
+    return jsonify({"version": new_version, "days": days})
+
+# Exercise autocomplete -----------------------------------------------------
+@app.route("/exercise_suggestions")
+@login_required
+def exercise_suggestions():
+    search_term = request.args.get("query", "")
+    limit = request.args.get("limit", app.config["SUGGESTIONS_LIMIT"], type=int)
+    limit = max(1, min(limit, app.config["SUGGESTIONS_MAX_LIMIT"]))
+
+    return jsonify(suggest_exercises(search_term, limit))
+
+@app.route("/exercise_search")
+@login_required
+def exercise_search():
+    search_term = request.args.get("q", "")
+    muscle_groups = request.args.getlist("muscle_group")
+    limit = request.args.get("limit", 20, type=int)
+    limit = max(1, min(limit, 100))
+
+    return jsonify(search_exercises(search_term, muscle_groups, limit))
 
 # Training session ---------------------------------------------------------
 @app.route("/training_session_redirect", methods=["GET"])
@@ -2286,6 +2816,8 @@ def training_session():
     DATE = NOW.strftime("%d%m%Y")
     YEAR = NOW.strftime("%Y")
 
+    status = 200
+
     # Function to acces workout day / data from database
     weekly, workout_names, workout_id = find_users_weeks()
 
@@ -2340,31 +2872,32 @@ def training_session():
                 chosen_exercise = load_chosen_exercise
 
     elif request.method == "POST":
-        if 'confirm_button' in request.form:
-            add_session_to_db(workout_key, workout_id)
-            submitted_data = request.form.to_dict()
-            add_set_to_db(submitted_data, chosen_exercise, chosen_day)
-            delete_set(submitted_data)
-            # Get access to sets / exercises user want to change
-            modify_set(submitted_data)
-
-        elif 'repeat_button' in request.form:
-            # If repeat button was clicked, last set will me "repeated"
-            repeat_set(chosen_exercise, workout_id, chosen_day)
-
-    sets_for_jinja = jinja_sets_function(chosen_day, chosen_exercise)
-
-    # Reset placeholders to zero after the first set is saved
-    if sets_for_jinja:
-        exercise_placeholders = {'weight': 0, 'reps': 0, 'rpe': 0, 'notes': '...'}
-    else:
-        exercise_placeholders = current_exercise_info(chosen_exercise, chosen_day)
-
-    preview = exercise_preview(workout_id, workout_key, chosen_exercise, workout_key, workout_id)
-    sets_to_do_jinja = sets_to_do(chosen_exercise, chosen_day)
-    
-    # Data for preview
-    last_exercise = last_exercise_preview(chosen_exercise, workout_id, chosen_day)
+        # Whole click is one transaction - one commit, nothing half saved
+        with unit_of_work() as work:
+            if 'confirm_button' in request.form:
+                add_session_to_db(workout_key, workout_id)
+                submitted_data = request.form.to_dict()
+                add_set_to_db(submitted_data, chosen_exercise, chosen_day)
+                delete_set(submitted_data)
+                # Get access to sets / exercises user want to change
+                modify_set(submitted_data)
+
+            elif 'repeat_button' in request.form:
+                # If repeat button was clicked, last set will me "repeated"
+                exercise_id = find_exercise_id_db(chosen_exercise)
+                if exercise_id is not None:
+                    repeat_set(add_session_to_db(workout_key, workout_id), exercise_id[0])
+
+            elif 'copy_session_button' in request.form:
+                # Whole previous session of this day -> today
+                if not copy_previous_session(add_session_to_db(workout_key, workout_id)):
+                    flash("Nothing to copy - no earlier session of this day has sets to add.", "warning")
+        if work["failed"]:
+            status = 500
+
+    # Sets, placeholders, preview and previous session in one statement
+    previous = max(request.args.get("previous", 1, type=int), 1)
+    view = load_training_session_view(workout_id[workout_key], exercises_from_user, chosen_exercise, previous)
 
     return render_template(
         "training_session.html",
@@ -2375,11 +2908,118 @@ def training_session():
         chosen_day=chosen_day,
         exercises_to_display=exercises_in_workout,
         chosen_exercise=chosen_exercise,
-        sets_for_jinja=sets_for_jinja,
-        preview=preview,
-        placeholders=exercise_placeholders,
-        last_exercise =last_exercise
-    )
+        # Fresh key for next form POST; refresh re-sends the old one and the set isn't doubled
+        client_key=str(uuid.uuid4()),
+        **view,
+    ), status
+
+# Set API (JSON) ------------------------------------------------------------
+@app.route("/api/sessions/<int:session_id>/sets", methods=["POST"])
+@login_required
+def api_create_set(session_id):
+    if owned_session(session_id) is None:
+        return jsonify({"error": "session not found"}), 404
+    data = request.get_json(silent=True) or {}
+    exercise_id = find_exercise_id_db(data.get("exercise"))
+    if exercise_id is None:
+        return jsonify({"error": "unknown exercise"}), 400
+    try:
+        values = parse_set_fields(data)
+        client_key = parse_client_key(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    entry = insert_set(session_id, exercise_id[0], **values, client_key=client_key)
+    sets = [set_to_json(entry)]
+    db.session.commit()
+    return jsonify({"sets": sets}), 201
+
+# Queued sets flushed at once: {"sets": [{"key": ..., "exercise": ..., "reps": ...}, ...]}
+# Valid sets are stored in one transaction (keys seen before are skipped), invalid ones come
+# back in "rejected" by key, so client drops only those from its queue and keeps the rest
+MAX_BATCH_SETS = 100
+@app.route("/api/sessions/<int:session_id>/sets/batch", methods=["POST"])
+@login_required
+def api_create_sets(session_id):
+    if owned_session(session_id) is None:
+        return jsonify({"error": "session not found"}), 404
+    queued = (request.get_json(silent=True) or {}).get("sets")
+    if not isinstance(queued, list) or not 0 < len(queued) <= MAX_BATCH_SETS:
+        return jsonify({"error": f"'sets' must be list of 1-{MAX_BATCH_SETS} sets"}), 400
+
+    sets, rejected = [], []
+    for position, data in enumerate(queued):
+        try:
+            sets.append(parse_queued_set(data))
+        except ValueError as e:
+            key = data.get("key") if isinstance(data, dict) else None
+            rejected.append({"position": position, "key": key, "error": str(e)})
+
+    if sets:
+        sets = [set_to_json(entry) for entry in insert_sets(session_id, sets)]
+        db.session.commit()
+    return jsonify({"sets": sets, "rejected": rejected})
+
+# One item of batch ready for insert_sets, raises ValueError with message for client
+def parse_queued_set(data) -> dict:
+    if not isinstance(data, dict):
+        raise ValueError("must be object")
+    client_key = parse_client_key(data)
+    if client_key is None:
+        raise ValueError("'key' is required")
+    exercise_id = find_exercise_id_db(data.get("exercise"))
+    if exercise_id is None:
+        raise ValueError("unknown exercise")
+    return {"exercise_id": exercise_id[0], "client_key": client_key, **parse_set_fields(data)}
+
+@app.route("/api/sessions/<int:session_id>/sets/repeat", methods=["POST"])
+@login_required
+def api_repeat_set(session_id):
+    if owned_session(session_id) is None:
+        return jsonify({"error": "session not found"}), 404
+    data = request.get_json(silent=True) or {}
+    exercise_id = find_exercise_id_db(data.get("exercise"))
+    if exercise_id is None:
+        return jsonify({"error": "unknown exercise"}), 400
+
+    # Copy of user's latest set of this exercise (today's or from last time)
+    entry = repeat_set(session_id, exercise_id[0])
+    db.session.commit()
+    if entry is None:
+        return jsonify({"error": "nothing to repeat"}), 409
+    return jsonify({"sets": [set_to_json(entry)]}), 201
+
+@app.route("/api/sessions/<int:session_id>/sets/copy_previous", methods=["POST"])
+@login_required
+def api_copy_previous_session(session_id):
+    if owned_session(session_id) is None:
+        return jsonify({"error": "session not found"}), 404
+    sets = [set_to_json(entry) for entry in copy_previous_session(session_id)]
+    db.session.commit()
+    if not sets:
+        return jsonify({"error": "nothing to copy"}), 409
+    return jsonify({"sets": sets}), 201
+
+@app.route("/api/sessions/<int:session_id>/sets/<int:entry_id>", methods=["PATCH", "DELETE"])
+@login_required
+def api_change_set(session_id, entry_id):
+    entry = db.session.get(ExerciseEntries, entry_id)
+    if owned_session(session_id) is None or entry is None or entry.session_id != session_id:
+        return jsonify({"error": "set not found"}), 404
+
+    if request.method == "DELETE":
+        db.session.delete(entry)
+        db.session.commit()
+        return jsonify({"deleted": [entry_id]})
+
+    try:
+        values = parse_set_fields(request.get_json(silent=True) or {}, partial=True)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    for field, value in values.items():
+        setattr(entry, field, value)
+    db.session.commit()
+    return jsonify({"sets": [set_to_json(entry)]})
 
 # --------------------------------------------------------------------------
 @login_required
@@ -2404,9 +3044,17 @@ def profile():
     elif action == 'change_password':
         # Handle changing password
         return "For now you need to contact admit to change your password. <br>This function will be added in the future.</br>" 
+    elif action == 'change_timezone':
+        # Training day (today's session) starts at midnight of this timezone
+        timezone_name = request.form.get("timezone", "").strip()
+        if timezone_name in available_timezones():
+            current_user.timezone = timezone_name
+            db.session.commit()
+        return redirect(url_for("profile"))
 
     return render_template(
         "profile.html",
+        timezones=sorted(available_timezones()),
     )
 
 # --------------------------------------------------------------------------
@@ -2538,6 +3186,22 @@ def statistics():
                            exercises = used_exercises
                            )
 
+@app.route("/exercise_history")
+@login_required
+def exercise_history_page():
+    chosen_exercise = request.args.get("exercise")
+    before = request.args.get("before", type=int)
+    exercise_id = find_exercise_id_db(chosen_exercise) if chosen_exercise else None
+
+    history = exercise_history(exercise_id[0], before) if exercise_id else None
+    return render_template("exercise_history.html",
+                           exercises=all_exercises_list(),
+                           chosen_exercise=chosen_exercise,
+                           history=history,
+                           before=before,
+                           year=datetime.now().strftime("%Y"),
+                           )
+
 @login_required
 @app.route("/intuitive_training", methods=["GET", "POST"])
 def intuitive_training():
@@ -2545,10 +3209,16 @@ def intuitive_training():
     YEAR = NOW.strftime("%Y")
     DATE = NOW.strftime("%d%m%Y")
     
+    # Old AJAX autocomplete URL, answer it before loading today's session
+    search_term = request.args.get("query")
+    if request.method == "GET" and search_term:
+        return jsonify(fetch_exercise_suggestions(search_term))
+
     selected_exercise = None
     exercise_name_for_last_sets = None
     sets_for_jinja = None
     last_day = None
+    status = 200
 
     # If new exercise, then pop cookie for chosen exe and vice versa 
     new_exercise = session.get("new_exercise", None)
@@ -2577,49 +3247,47 @@ def intuitive_training():
                 return redirect(url_for('intuitive_training'))
         else:
             print('No confirmation yet')
-            
-        # Check if there are already some exercies in workout - In case website / webbrowser would crash and we had no POST after openin :)
-        search_term = request.args.get("query")
-        if search_term:
-            exercise_names = fetch_exercise_suggestions(search_term)
-            return jsonify(exercise_names)
-        
+
     else:  # POST
-        submitted_data = request.form.to_dict()
-        delete_set(submitted_data)
-        action = submitted_data.get("action")
-
-        if action == "choose_exercise":
-            chosen_exercise = submitted_data.get("chosen_exercise")
-            if chosen_exercise:
-                session["chosen_exercise_by_user"] = chosen_exercise
-                session.pop("new_exercise", None)
-                return redirect(url_for("intuitive_training"))
-
-        elif action == "add_exercise_name":
-            # Same as choose_exercise this will aslo set new exercise as
-            # currently exercised
-            new_exercise = submitted_data.get("exercise")
-
-            if new_exercise:
-               create_custom_workout_exercise(new_exercise)
-               session["new_exercise"] = new_exercise
-               session.pop("chosen_exercise_by_user", None)
-               return redirect(url_for("intuitive_training"))
-            else:
-                pass
+        # Deleted sets and new set - one transaction
+        with unit_of_work() as work:
+            submitted_data = request.form.to_dict()
+            delete_set(submitted_data)
+            action = submitted_data.get("action")
+
+            if action == "choose_exercise":
+                chosen_exercise = submitted_data.get("chosen_exercise")
+                if chosen_exercise:
+                    session["chosen_exercise_by_user"] = chosen_exercise
+                    session.pop("new_exercise", None)
+                    return redirect(url_for("intuitive_training"))
+
+            elif action == "add_exercise_name":
+                # Same as choose_exercise this will aslo set new exercise as
+                # currently exercised
+                new_exercise = submitted_data.get("exercise")
+
+                if new_exercise:
+                   create_custom_workout_exercise(new_exercise)
+                   session["new_exercise"] = new_exercise
+                   session.pop("chosen_exercise_by_user", None)
+                   return redirect(url_for("intuitive_training"))
+                else:
+                    pass
             
-        if submitted_data.get("reps"):
-            day_for_function = "c"
-            add_set_to_db(submitted_data, selected_exercise, day_for_function)
-            print('reps_to_save are provided correctly')
+            if submitted_data.get("reps"):
+                day_for_function = WorkoutKind.CUSTOM
+                add_set_to_db(submitted_data, selected_exercise, day_for_function)
+                print('reps_to_save are provided correctly')
+        if work["failed"]:
+            status = 500
     
     # Check for last sets
     if chosen_exercise_dropdown_i:
         last_day = last_custom_day(chosen_exercise_dropdown_i)
         exercise_name_for_last_sets = chosen_exercise_dropdown_i
     if chosen_exercise_dropdown_i:
-        sets_for_jinja = jinja_sets_function("c", chosen_exercise_dropdown_i)
+        sets_for_jinja = jinja_sets_function(WorkoutKind.CUSTOM, chosen_exercise_dropdown_i)
         
 
     if not sets_for_jinja:
@@ -2629,7 +3297,7 @@ def intuitive_training():
     if sets_for_jinja:
         exercise_placeholders = {'weight': 0, 'reps': 0, 'rpe': 0, 'notes': '...'}
     else:
-        exercise_placeholders = current_exercise_info(chosen_exercise_dropdown_i, "c")
+        exercise_placeholders = current_exercise_info(chosen_exercise_dropdown_i, WorkoutKind.CUSTOM)
 
     return render_template(
         "intuitive_training.html",
@@ -2642,6 +3310,22 @@ def intuitive_training():
         placeholders= exercise_placeholders,
         preview = last_day,
         current_exercise_name = exercise_name_for_last_sets
+    ), status
+
+@app.route("/plan_cache_stats")
+@login_required
+def plan_cache_statistics():
+    with plan_cache_lock:
+        hits, misses = plan_cache_stats["hits"], plan_cache_stats["misses"]
+        size = len(plan_cache)
+    lookups = hits + misses
+
+    return jsonify(
+        hits=hits,
+        misses=misses,
+        hit_ratio=round(hits / lookups, 3) if lookups else None,
+        size=size,
+        max_size=app.config["PLAN_CACHE_SIZE"],
     )
 
 @app.errorhandler(404)
@@ -2657,7 +3341,327 @@ def page_not_found(e):
         year=YEAR,
     ), 404
 
+# Schema migrations ---------------------------------------------------------------
+# flask --app server db-upgrade   -> apply pending migrations
+# flask --app server db-status    -> list applied / pending migrations
+#
+# Applied versions are stored in schema_migrations. Every migration runs in its own
+# transaction, batched ones (backfills of big tables) commit every batch and keep
+# checkpoint in schema_migration_progress, so interrupted run continues where it stopped
+# and no write lock is held for longer than one batch.
+app.config["MIGRATION_BATCH_SIZE"] = 5000
+
+MIGRATIONS = []
+def migration(version, name, batched=False):
+    def register(function):
+        MIGRATIONS.append({"version": version, "name": name, "batched": batched, "function": function})
+        MIGRATIONS.sort(key=lambda m: m["version"])
+        return function
+    return register
+def column_exists(connection, table, column) -> bool:
+    columns = connection.execute(text(f"PRAGMA table_info({table})")).all()
+    return any(row.name == column for row in columns)
+def add_column(connection, table, column, column_ddl) -> None:
+    if not column_exists(connection, table, column):
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN "{column}" {column_ddl}'))
+# Model indexes by name - every migration lists its own, so no index (unique one especially) is
+# created before the migration that prepares its columns and data
+def create_model_indexes(connection, *names) -> None:
+    indexes = {index.name: index for table in db.metadata.sorted_tables for index in table.indexes}
+    for name in names:
+        indexes[name].create(connection, checkfirst=True)
+# UPDATE table in rowid ranges, one short transaction per batch + checkpoint after each
+def backfill_in_batches(engine, version, table, assignments, condition=None, batch_size=None) -> None:
+    batch_size = batch_size or app.config["MIGRATION_BATCH_SIZE"]
+    condition = f"AND ({condition})" if condition else ""
+
+    with engine.begin() as connection:
+        last_rowid = connection.execute(
+            text("SELECT last_rowid FROM schema_migration_progress WHERE version = :version"),
+            {"version": version},
+        ).scalar() or 0
+        max_rowid = connection.execute(text(f"SELECT max(rowid) FROM {table}")).scalar() or 0
+
+    while last_rowid < max_rowid:
+        upper = last_rowid + batch_size
+        with engine.begin() as connection:
+            connection.execute(
+                text(f"UPDATE {table} SET {assignments} WHERE rowid > :last AND rowid <= :upper {condition}"),
+                {"last": last_rowid, "upper": upper},
+            )
+            connection.execute(
+                text("""
+                    INSERT INTO schema_migration_progress (version, last_rowid) VALUES (:version, :upper)
+                    ON CONFLICT (version) DO UPDATE SET last_rowid = excluded.last_rowid
+                """),
+                {"version": version, "upper": upper},
+            )
+        last_rowid = upper
+        click.echo(f"  {table}: {min(last_rowid, max_rowid)}/{max_rowid} rows")
+def applied_migrations(connection) -> dict:
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migration_progress (
+            version INTEGER PRIMARY KEY,
+            last_rowid INTEGER NOT NULL
+        )
+    """))
+    rows = connection.execute(text("SELECT version, applied_at FROM schema_migrations")).all()
+    return {row.version: row.applied_at for row in rows}
+def upgrade_database(batch_size=None) -> list:
+    engine = db.engine
+    with engine.begin() as connection:
+        applied = applied_migrations(connection)
+
+    done = []
+    for step in MIGRATIONS:
+        if step["version"] in applied:
+            continue
+        click.echo(f"Applying migration {step['version']}: {step['name']}")
+
+        if step["batched"]:
+            step["function"](engine, batch_size)
+            with engine.begin() as connection:
+                connection.execute(
+                    text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                    {"version": step["version"], "name": step["name"]},
+                )
+                connection.execute(
+                    text("DELETE FROM schema_migration_progress WHERE version = :version"),
+                    {"version": step["version"]},
+                )
+        else:
+            with engine.begin() as connection:
+                step["function"](connection)
+                connection.execute(
+                    text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                    {"version": step["version"], "name": step["name"]},
+                )
+        done.append(step["version"])
+    return done
+# Fresh database gets current schema from models, migrations after it only fill the gaps
+@migration(1, "create tables from models")
+def migration_create_tables(connection):
+    db.metadata.create_all(connection)
+@migration(2, "add session_end to sessions")
+def migration_session_end(connection):
+    add_column(connection, "sessions", "session_end", "DATETIME")
+@migration(3, "add plan_version to users")
+def migration_plan_version(connection):
+    add_column(connection, "users", "plan_version", "INTEGER NOT NULL DEFAULT 0")
+@migration(4, "exercise full text search")
+def migration_exercise_search(connection):
+    for statement in EXERCISE_SEARCH_DDL:
+        connection.execute(text(statement))
+@migration(5, "indexes for hot filter paths")
+def migration_hot_path_indexes(connection):
+    create_model_indexes(
+        connection,
+        "ix_workouts_user_mesocycle_created",
+        "ix_workout_exercises_workout_exercise",
+        "ix_sessions_user_workout_date",
+        "ix_mesocycles_user_mesocycle",
+    )
+    connection.execute(text("ANALYZE"))
+@migration(6, "add timezone to users and training_day to sessions")
+def migration_training_day(connection):
+    add_column(connection, "users", "timezone", "VARCHAR(64) NOT NULL DEFAULT 'UTC'")
+    add_column(connection, "sessions", "training_day", "DATE")
+    create_model_indexes(connection, "ix_sessions_user_training_day")
+@migration(7, "backfill sessions.training_day", batched=True)
+def migration_backfill_training_day(engine, batch_size):
+    # Every user starts in UTC and session_date is UTC, so the day is just date(session_date)
+    backfill_in_batches(engine, 7, "sessions", "training_day = date(session_date)",
+                        "training_day IS NULL", batch_size)
+@migration(8, "add kind to workouts and sessions")
+def migration_workout_kind(connection):
+    add_column(connection, "workouts", "kind", "VARCHAR(16) NOT NULL DEFAULT 'planned'")
+    add_column(connection, "sessions", "kind", "VARCHAR(16) NOT NULL DEFAULT 'planned'")
+    create_model_indexes(connection, "ix_workouts_user_kind_created", "ix_sessions_user_kind_date")
+    connection.execute(text("UPDATE workouts SET kind = 'custom' WHERE workout_name = 'c'"))
+    connection.execute(text(r"UPDATE workouts SET kind = 'intuitive' WHERE workout_name LIKE '%\_intuitive' ESCAPE '\'"))
+@migration(9, "move custom sessions from workout_id 'c' to their custom workout", batched=True)
+def migration_custom_sessions(engine, batch_size):
+    # Custom workout and its session are created in the same request -> same UTC day
+    backfill_in_batches(engine, 9, "sessions", """
+        kind = 'custom',
+        workout_id = (
+            SELECT workouts.workout_id FROM workouts
+            WHERE workouts.user_id = sessions.user_id AND workouts.kind = 'custom'
+              AND date(workouts.created_at) = date(sessions.session_date)
+            ORDER BY workouts.created_at DESC LIMIT 1
+        )""", "workout_id = 'c'", batch_size)
+@migration(10, "index for latest set per exercise")
+def migration_latest_sets_index(connection):
+    create_model_indexes(connection, "ix_exercise_entries_exercise_session")
+    connection.execute(text("ANALYZE exercise_entries"))
+@migration(11, "client idempotency key on exercise_entries")
+def migration_set_client_key(connection):
+    add_column(connection, "exercise_entries", "client_key", "VARCHAR(36)")
+    create_model_indexes(connection, "ux_exercise_entries_session_client_key")
+@migration(12, "unique set numbers per exercise in session")
+def migration_unique_set_numbers(connection):
+    # Count-based numbering left duplicates (overlapping requests, deleted sets, repeat_set
+    # reusing the count); such groups are renumbered from 0 in the order sets were logged
+    connection.execute(text("""
+        UPDATE exercise_entries SET set_number = numbered.position
+        FROM (
+            SELECT entry_id,
+                   ROW_NUMBER() OVER (PARTITION BY session_id, exercise_id ORDER BY entry_id) - 1 AS position
+            FROM exercise_entries
+            WHERE (session_id, exercise_id) IN (
+                SELECT session_id, exercise_id FROM exercise_entries
+                GROUP BY session_id, exercise_id, set_number HAVING count(*) > 1
+            )
+        ) AS numbered
+        WHERE exercise_entries.entry_id = numbered.entry_id
+    """))
+    # Unique index starts with the same columns, old one would be dead weight
+    connection.execute(text("DROP INDEX IF EXISTS ix_exercise_entries_session_exercise"))
+    create_model_indexes(connection, "ux_exercise_entries_session_exercise_set")
+@migration(13, "order exercises of a day by order_in_workout")
+def migration_exercise_order(connection):
+    # Days were shown in insert order and count() based numbers repeat, so every day is
+    # renumbered 1..n in the order users saw it before order_in_workout was read
+    connection.execute(text("""
+        UPDATE workout_exercises SET order_in_workout = numbered.position
+        FROM (
+            SELECT workout_exercise_id,
+                   ROW_NUMBER() OVER (PARTITION BY workout_id ORDER BY workout_exercise_id) AS position
+            FROM workout_exercises
+        ) AS numbered
+        WHERE workout_exercises.workout_exercise_id = numbered.workout_exercise_id
+          AND workout_exercises.order_in_workout IS NOT numbered.position
+    """))
+    # Index for this order (workout_id, to_version, order_in_workout) comes with migration 15
+@migration(14, "plan templates")
+def migration_plan_templates(connection):
+    PlanTemplates.__table__.create(connection, checkfirst=True)
+    add_column(connection, "workouts", "template_id", "INTEGER REFERENCES plan_templates (template_id)")
+    create_model_indexes(connection, "ix_workouts_template", "ix_plan_templates_user")
+@migration(15, "copy-on-write plan rows and plan version of sessions")
+def migration_plan_row_versions(connection):
+    # Existing rows were edited in place, so they are simply valid from the start
+    add_column(connection, "workout_exercises", "from_version", "INTEGER NOT NULL DEFAULT 0")
+    add_column(connection, "workout_exercises", "to_version", "INTEGER")
+    add_column(connection, "sessions", "plan_version", "INTEGER")
+    # Readers of current plan filter to_version IS NULL, new index leads with the same columns
+    connection.execute(text("DROP INDEX IF EXISTS ix_workout_exercises_workout_order"))
+    create_model_indexes(connection, "ix_workout_exercises_workout_current")
+@migration(16, "backfill sessions.plan_version", batched=True)
+def migration_backfill_session_plan_version(engine, batch_size):
+    # History before versioning was rewritten in place, current version is all it can point to
+    backfill_in_batches(engine, 16, "sessions", """
+        plan_version = (SELECT users.plan_version FROM users WHERE users.user_id = sessions.user_id)""",
+        "plan_version IS NULL", batch_size)
+def init_db() -> None:
+    upgrade_database()
+@app.cli.command("db-upgrade")
+@click.option("--batch-size", default=None, type=int, help="Rows per batch for backfills")
+def db_upgrade_command(batch_size):
+    """Apply pending schema migrations."""
+    start = time.perf_counter()
+    done = upgrade_database(batch_size)
+    elapsed = time.perf_counter() - start
+    if done:
+        click.echo(f"Applied migrations {done} in {elapsed:.2f} s")
+    else:
+        click.echo("Database is up to date")
+@app.cli.command("db-status")
+def db_status_command():
+    """List applied and pending schema migrations."""
+    with db.engine.begin() as connection:
+        applied = applied_migrations(connection)
+    for step in MIGRATIONS:
+        state = f"applied {applied[step['version']]}" if step["version"] in applied else "pending"
+        click.echo(f"{step['version']:>3}  {step['name']:<40} {state}")
+
+# Exercise catalog ingest -----------------------------------------------------
+# flask --app server import-exercises [--source "Excercise Database"]
+EXERCISE_FILES_DIR = os.path.join(basedir, "Excercise Database")
+def normalize_exercise_name(name) -> str:
+    # NFKC folds odd unicode (non breaking spaces, ligatures) from scraped pages
+    return " ".join(unicodedata.normalize("NFKC", name).split())
+# Stream (exercise_name, muscle_group) from every <muscle_group>_exercises.txt file
+def read_exercise_files(source):
+    for path in sorted(glob.glob(os.path.join(source, "*_exercises.txt"))):
+        muscle_group = os.path.basename(path).removesuffix("_exercises.txt")
+        with open(path, encoding="utf-8-sig") as file:
+            for line in file:
+                name = normalize_exercise_name(line)
+                if name:
+                    yield name, muscle_group
+def import_exercises(source, batch_size=1000) -> dict:
+    report = {"read": 0, "duplicates": 0, "inserted": 0, "updated": 0, "unchanged": 0}
+
+    # Existing catalog keyed by lower case name, so "Ab Roll" and "ab roll" are one exercise
+    existing = {
+        row.exercise_name.lower(): (row.exercise_name, row.muscle_group)
+        for row in db.session.execute(select(Exercise.exercise_name, Exercise.muscle_group))
+    }
+
+    seen = set()
+    changes = []
+    for name, muscle_group in read_exercise_files(source):
+        report["read"] += 1
+        key = name.lower()
+        if key in seen:
+            report["duplicates"] += 1
+            continue
+        seen.add(key)
+
+        if key not in existing:
+            report["inserted"] += 1
+            changes.append({"exercise_name": name, "muscle_group": muscle_group})
+        elif existing[key][1] != muscle_group:
+            report["updated"] += 1
+            changes.append({"exercise_name": existing[key][0], "muscle_group": muscle_group})
+        else:
+            report["unchanged"] += 1
+
+    upsert = text("""
+        INSERT INTO exercises (exercise_name, muscle_group)
+        VALUES (:exercise_name, :muscle_group)
+        ON CONFLICT (exercise_name) DO UPDATE SET muscle_group = excluded.muscle_group
+        WHERE exercises.muscle_group != excluded.muscle_group
+    """)
+    # One transaction, executemany per batch. Nothing to change -> no writes at all
+    try:
+        for start in range(0, len(changes), batch_size):
+            db.session.execute(upsert, changes[start:start + batch_size])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if changes:
+        invalidate_exercise_catalog()
+    return report
+@app.cli.command("import-exercises")
+@click.option("--source", default=EXERCISE_FILES_DIR, show_default=True,
+              type=click.Path(exists=True, file_okay=False), help="Folder with *_exercises.txt files")
+@click.option("--batch-size", default=1000, show_default=True, help="Rows per executemany batch")
+def import_exercises_command(source, batch_size):
+    """Load exercises from body part text files into exercises table (safe to re-run)."""
+    start = time.perf_counter()
+    report = import_exercises(source, batch_size)
+    elapsed = time.perf_counter() - start
+
+    rate = report["read"] / elapsed if elapsed else 0
+    click.echo(
+        f"Read {report['read']} rows ({report['duplicates']} duplicates): "
+        f"{report['inserted']} inserted, {report['updated']} updated, {report['unchanged']} unchanged"
+    )
+    click.echo(f"Done in {elapsed * 1000:.1f} ms ({rate:,.0f} rows/s)")
+
 if __name__ == "__main__":
     with app.app_context():
-        db.create_all()
+        init_db()
+        load_exercise_catalog()
     app.run(debug=True) # Delete this before pushing
@@ -3,7 +3,7 @@ document.getElementById("new_exercise").addEventListener("input", function() {
     let query = this.value;
     if (query.length > 0) {
         let xhr = new XMLHttpRequest();
-        xhr.open("GET", "/create_workout?query=" + query, true);  // Use /create_workout route for AJAX
+        xhr.open("GET", "/exercise_suggestions?query=" + encodeURIComponent(query), true);  // Lightweight autocomplete endpoint
         xhr.onreadystatechange = function() {
             if (xhr.readyState == 4 && xhr.status == 200) {
                 let response = JSON.parse(xhr.responseText);
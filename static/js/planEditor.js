@@ -0,0 +1,95 @@
+// ---- Drag and drop order of exercises in plan editor ------------------
+// Row is dragged by its handle inside its day; new order of the day is sent to /api/plan as
+// one "reorder" operation. Form field names are renumbered, so Save still matches the rows.
+"use strict";
+
+const planEditor = document.getElementById("plan_editor");
+let planVersion = Number(planEditor.dataset.planVersion);
+let draggedRow = null;
+
+function sendJson(method, url, body) {
+    return fetch(url, {
+        method: method,
+        headers: {"Content-Type": "application/json"},
+        body: body ? JSON.stringify(body) : undefined,
+    }).then(response => response.json().then(data => {
+        if (!response.ok) {
+            let error = new Error(data.error || response.statusText);
+            error.status = response.status;
+            throw error;
+        }
+        return data;
+    }));
+}
+
+function exerciseRows(tbody) {
+    return Array.from(tbody.querySelectorAll("tr[data-workout-exercise-id]"));
+}
+
+function dayOrder(tbody) {
+    return exerciseRows(tbody).map(tr => Number(tr.dataset.workoutExerciseId));
+}
+
+// exercise_/sets_/pauses_/remove_{day}_{idx} follow position in the table
+function renumberRows(tbody) {
+    exerciseRows(tbody).forEach((tr, idx) => {
+        tr.querySelectorAll("input[name]").forEach(input => {
+            input.name = input.name.replace(/^(exercise|sets|pauses|remove)_(\d+)_\d+$/, "$1_$2_" + idx);
+        });
+    });
+}
+
+function saveOrder(tbody) {
+    let order = dayOrder(tbody);
+    if (order.join() === tbody.dataset.savedOrder) {
+        return;
+    }
+    renumberRows(tbody);
+    sendJson("PATCH", "/api/plan", {
+        version: planVersion,
+        operations: [{op: "reorder", workout_id: Number(tbody.dataset.workoutId), order: order}],
+    }).then(data => {
+        planVersion = data.version;
+        // Save of the form is checked against version too, this tab's own reorder is not a conflict
+        document.querySelector('input[name="plan_version"]').value = data.version;
+        tbody.dataset.savedOrder = order.join();
+    }).catch(error => {
+        // Plan changed in another tab (409) or request failed -> show what is really saved
+        alert("Saving order failed: " + error.message);
+        location.reload();
+    });
+}
+
+document.querySelectorAll("tbody[data-workout-id]").forEach(tbody => {
+    tbody.dataset.savedOrder = dayOrder(tbody).join();
+
+    // Only the handle starts dragging, inputs of the row keep normal text selection
+    tbody.addEventListener("mousedown", event => {
+        let handle = event.target.closest(".drag-handle");
+        if (handle) {
+            handle.parentNode.draggable = true;
+        }
+    });
+    tbody.addEventListener("dragstart", event => {
+        draggedRow = event.target.closest("tr[data-workout-exercise-id]");
+        event.dataTransfer.effectAllowed = "move";
+    });
+    tbody.addEventListener("dragover", event => {
+        let row = event.target.closest("tr[data-workout-exercise-id]");
+        if (!draggedRow || !row || row === draggedRow || row.parentNode !== draggedRow.parentNode) {
+            return;
+        }
+        event.preventDefault();
+        let box = row.getBoundingClientRect();
+        row.parentNode.insertBefore(draggedRow, event.clientY > box.top + box.height / 2 ? row.nextSibling : row);
+    });
+    tbody.addEventListener("drop", event => event.preventDefault());
+    tbody.addEventListener("dragend", () => {
+        if (!draggedRow) {
+            return;
+        }
+        draggedRow.draggable = false;
+        draggedRow = null;
+        saveOrder(tbody);
+    });
+});
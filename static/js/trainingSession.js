@@ -0,0 +1,188 @@
+// ---- Set logging without page reload --------------------------------
+// Confirm / Repeat talk to /api/sessions/<id>/sets and only changed rows are redrawn.
+// Without today's session (first set of the day) the form is submitted as before.
+// New sets wait in localStorage queue with client key until server confirms them, so sets
+// logged without signal are sent together later and a retried batch is not stored twice.
+"use strict";
+
+const setsForm = document.getElementById("sets_form");
+const setsBody = document.getElementById("sets_body");
+
+function setsUrl(path) {
+    return "/api/sessions/" + setsForm.dataset.sessionId + "/sets" + (path || "");
+}
+
+function sendJson(method, url, body) {
+    return fetch(url, {
+        method: method,
+        headers: {"Content-Type": "application/json"},
+        body: body ? JSON.stringify(body) : undefined,
+    }).then(response => response.json().then(data => {
+        if (!response.ok) {
+            let error = new Error(data.error || response.statusText);
+            error.status = response.status;
+            throw error;
+        }
+        return data;
+    }));
+}
+
+// Same markup as saved set row in training_session.html
+function setCell(type, name, placeholder) {
+    let td = document.createElement("td");
+    let input = document.createElement("input");
+    input.type = type;
+    input.name = name;
+    input.className = "form-control text-center";
+    input.placeholder = placeholder === null ? "" : placeholder;
+    if (name.startsWith("update_weight_")) {
+        input.step = "any";
+    }
+    td.appendChild(input);
+    return td;
+}
+
+function setRow(set) {
+    let tr = document.createElement("tr");
+    tr.dataset.entryId = set.entry_id;
+    tr.appendChild(setCell("number", "update_weight_" + set.entry_id, set.weight));
+    tr.appendChild(setCell("number", "update_reps_" + set.entry_id, set.reps));
+    tr.appendChild(setCell("number", "update_rpe_" + set.entry_id, set.rpe));
+    tr.appendChild(setCell("text", "update_notes_" + set.entry_id, set.notes));
+
+    let td = document.createElement("td");
+    td.className = "w-auto";
+    let checkbox = document.createElement("input");
+    checkbox.className = "form-check-input";
+    checkbox.type = "checkbox";
+    checkbox.name = "delete";
+    checkbox.value = set.entry_id;
+    td.appendChild(checkbox);
+    tr.appendChild(td);
+    return tr;
+}
+
+function drawSets(sets) {
+    sets.forEach(set => {
+        let row = setRow(set);
+        let old = setsBody.querySelector('tr[data-entry-id="' + set.entry_id + '"]');
+        if (old) {
+            old.replaceWith(row);
+        } else {
+            setsBody.insertBefore(row, document.getElementById("new_set_row"));
+        }
+    });
+    // Exercise was done today -> green row in preview
+    document.querySelectorAll("tr[data-preview-exercise]").forEach(tr => {
+        if (tr.dataset.previewExercise === setsForm.dataset.exercise) {
+            tr.classList.add("table-success");
+        }
+    });
+}
+
+// ---- Queue of sets not confirmed by server ----
+function queueName() {
+    return "pendingSets_" + setsForm.dataset.sessionId;
+}
+
+function pendingSets() {
+    return JSON.parse(localStorage.getItem(queueName()) || "[]");
+}
+
+function savePendingSets(sets) {
+    if (sets.length > 0) {
+        localStorage.setItem(queueName(), JSON.stringify(sets));
+    } else {
+        localStorage.removeItem(queueName());
+    }
+}
+
+function clientKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return Date.now().toString(36) + "-" + Math.random().toString(36).slice(2);
+}
+
+function flushPendingSets() {
+    let queued = pendingSets();
+    if (queued.length === 0) {
+        return Promise.resolve();
+    }
+    return sendJson("POST", setsUrl("/batch"), {sets: queued}).then(data => {
+        // Stored and rejected sets leave queue, sets queued while request was running stay for next flush
+        let sent = new Set(queued.map(set => set.key));
+        savePendingSets(pendingSets().filter(set => !sent.has(set.key)));
+        drawSets(data.sets);
+        if (data.rejected.length > 0) {
+            throw new Error(data.rejected.length + " set(s) rejected: "
+                + data.rejected.map(item => item.error).join(", "));
+        }
+    }, error => {
+        // Whole request failed (no connection, server down, session not found ...) - keep queue,
+        // next confirm or "online" event sends it again
+        throw new Error(error.message + ", " + pendingSets().length + " set(s) will be sent later");
+    });
+}
+
+function newSetInput(name) {
+    return document.querySelector('#new_set_row input[name="' + name + '"]');
+}
+
+function confirmSets() {
+    let requests = [];
+
+    // Edited and deleted sets
+    setsBody.querySelectorAll("tr[data-entry-id]").forEach(tr => {
+        let entryId = tr.dataset.entryId;
+        if (tr.querySelector('input[name="delete"]').checked) {
+            requests.push(sendJson("DELETE", setsUrl("/" + entryId)).then(() => tr.remove()));
+            return;
+        }
+        let changes = {};
+        ["weight", "reps", "rpe", "notes"].forEach(field => {
+            let value = tr.querySelector('input[name="update_' + field + "_" + entryId + '"]').value;
+            if (value !== "") {
+                changes[field] = value;
+            }
+        });
+        if (Object.keys(changes).length > 0) {
+            requests.push(sendJson("PATCH", setsUrl("/" + entryId), changes).then(data => drawSets(data.sets)));
+        }
+    });
+
+    // New set - needs at least weight or reps, same as form flow
+    let inputs = {weight: newSetInput("kg"), reps: newSetInput("reps"), rpe: newSetInput("rpe"), notes: newSetInput("notes")};
+    if (inputs.weight.value !== "" || inputs.reps.value !== "") {
+        let set = {key: clientKey(), exercise: setsForm.dataset.exercise};
+        Object.keys(inputs).forEach(field => set[field] = inputs[field].value);
+        savePendingSets(pendingSets().concat([set]));
+        Object.values(inputs).forEach(input => input.value = "");
+    }
+    requests.push(flushPendingSets());
+    return Promise.all(requests);
+}
+
+setsForm.addEventListener("submit", function(event) {
+    if (!setsForm.dataset.sessionId || !setsForm.dataset.exercise) {
+        return;  // First set of the day -> classic POST creates today's session
+    }
+    if (event.submitter && event.submitter.name === "copy_session_button") {
+        return;  // Copy changes every exercise of the day -> whole page is rendered again
+    }
+    event.preventDefault();
+
+    let request;
+    if (event.submitter && event.submitter.name === "repeat_button") {
+        request = sendJson("POST", setsUrl("/repeat"), {exercise: setsForm.dataset.exercise})
+            .then(data => drawSets(data.sets));
+    } else {
+        request = confirmSets();
+    }
+    request.catch(error => alert("Saving set failed: " + error.message));
+});
+
+if (setsForm.dataset.sessionId) {
+    window.addEventListener("online", () => flushPendingSets().catch(() => {}));
+    flushPendingSets().catch(() => {});
+}
@@ -0,0 +1,78 @@
+import os
+import sys
+from contextlib import contextmanager
+
+import pytest
+
+# Throwaway in-memory database, must be set before server.py reads it
+os.environ["DATABASE_URL"] = "sqlite://"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+import server
+from server import Exercise, ExerciseEntries, Mesocycles, Sessions, Users, WorkoutExercises, WorkoutPlan, app, db
+
+EXERCISES = ["Barbell Bench Press", "Barbell Row", "Barbell Squat", "Romanian Deadlift"]
+
+
+@pytest.fixture()
+def client():
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        server.init_db()
+        seed_plan_and_history()
+        server.load_exercise_catalog()  # Loaded at startup like in server.py __main__
+    # Requests run outside the fixture's app context, so each gets its own flask.g like in production
+    yield app.test_client()
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+    server.invalidate_exercise_catalog()
+    with server.plan_cache_lock:
+        server.plan_cache.clear()
+
+
+def seed_plan_and_history():
+    user = Users(username="test", password=generate_password_hash("test"), age=30, weight=80, email="test@example.com")
+    db.session.add(user)
+    db.session.add_all(Exercise(name, "chest") for name in EXERCISES)
+    db.session.flush()
+
+    mesocycle = Mesocycles(user.user_id, 4, 2, "Test mesocycle")
+    db.session.add(mesocycle)
+    db.session.flush()
+    exercise_ids = [exercise.exercise_id for exercise in db.session.query(Exercise).order_by(Exercise.exercise_id)]
+    for day in range(2):
+        workout = WorkoutPlan(user.user_id, f"Day {day + 1}", mesocycle.mesocycle_id)
+        db.session.add(workout)
+        db.session.flush()
+        for order, exercise_id in enumerate(exercise_ids[day * 2:day * 2 + 2], start=1):
+            db.session.add(WorkoutExercises(workout.workout_id, exercise_id, order, 3, 120))
+            # Earlier session of the day with sets -> history part of the page has rows to load
+            session = Sessions(user.user_id, workout.workout_id, "")
+            db.session.add(session)
+            db.session.flush()
+            db.session.add_all(
+                ExerciseEntries(session.session_id, exercise_id, set_number, 8, 60.0, 8, "")
+                for set_number in range(3)
+            )
+    db.session.commit()
+
+
+@contextmanager
+def count_statements():
+    counter = {"statements": 0}
+
+    def before_cursor_execute(*args):
+        counter["statements"] += 1
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
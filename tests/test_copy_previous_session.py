@@ -0,0 +1,37 @@
+from server import ExerciseEntries, Sessions, app, db
+
+
+def add_session(workout_id=1):
+    with app.app_context():
+        session = Sessions(1, workout_id, "")
+        db.session.add(session)
+        db.session.commit()
+        return session.session_id
+
+
+def test_copy_skips_earlier_session_without_sets(client):
+    client.post("/login", data={"username": "test", "password": "test"})
+    with app.app_context():
+        latest_with_sets = db.session.query(db.func.max(ExerciseEntries.session_id)).join(Sessions).filter(
+            Sessions.workout_id == 1
+        ).scalar()
+    add_session()  # Started and left empty
+    session_id = add_session()
+
+    response = client.post(f"/api/sessions/{session_id}/sets/copy_previous")
+
+    assert response.status_code == 201
+    with app.app_context():
+        copied = db.session.query(ExerciseEntries).filter(ExerciseEntries.session_id == latest_with_sets).count()
+    assert len(response.json["sets"]) == copied == 3
+
+
+def test_copy_with_nothing_to_copy_is_conflict(client):
+    client.post("/login", data={"username": "test", "password": "test"})
+    session_id = add_session()
+    client.post(f"/api/sessions/{session_id}/sets/copy_previous")
+
+    response = client.post(f"/api/sessions/{session_id}/sets/copy_previous")
+
+    assert response.status_code == 409
+    assert response.json == {"error": "nothing to copy"}
@@ -0,0 +1,21 @@
+def test_noop_patch_keeps_plan_version(client):
+    client.post("/login", data={"username": "test", "password": "test"})
+    plan = client.get("/api/plan").json
+    version, day = plan["version"], plan["days"][0]
+    order = [row["workout_exercise_id"] for row in day["exercises"]]
+
+    response = client.patch("/api/plan", json={"version": version, "operations": [
+        {"op": "rename", "workout_id": day["workout_id"], "name": day["name"]},
+        {"op": "reorder", "workout_id": day["workout_id"], "order": order},
+    ]})
+
+    assert response.status_code == 200
+    assert response.json["version"] == version
+    assert client.get("/api/plan").json["version"] == version
+
+    # Another client editing from the same version is not turned away
+    response = client.patch("/api/plan", json={"version": version, "operations": [
+        {"op": "reorder", "workout_id": day["workout_id"], "order": list(reversed(order))},
+    ]})
+    assert response.status_code == 200
+    assert response.json["version"] == version + 1
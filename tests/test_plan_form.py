@@ -0,0 +1,38 @@
+def first_day_sets(client):
+    return [row["sets"] for row in client.get("/api/plan").json["days"][0]["exercises"]]
+
+
+def save_form(client, version, sets):
+    return client.post("/create_workout", data={
+        "plan_version": version,
+        "exercise_0_0": "Barbell Bench Press", "sets_0_0": sets, "pauses_0_0": "120",
+        "exercise_0_1": "Barbell Row", "sets_0_1": "3", "pauses_0_1": "120",
+    })
+
+
+def test_form_saved_from_current_plan_is_applied(client):
+    client.post("/login", data={"username": "test", "password": "test"})
+    version = client.get("/api/plan").json["version"]
+
+    response = save_form(client, version, "5")
+
+    assert response.status_code == 302
+    assert first_day_sets(client) == [5, 3]
+
+
+def test_form_saved_from_changed_plan_is_refused(client):
+    client.post("/login", data={"username": "test", "password": "test"})
+    plan = client.get("/api/plan").json
+    day = plan["days"][0]
+    order = [row["workout_exercise_id"] for row in day["exercises"]]
+    # Other tab moves rows - form positions now point at different exercises
+    client.patch("/api/plan", json={"version": plan["version"], "operations": [
+        {"op": "reorder", "workout_id": day["workout_id"], "order": list(reversed(order))},
+    ]})
+
+    response = save_form(client, plan["version"], "5")
+
+    assert response.status_code == 409
+    assert b"Plan was changed meanwhile" in response.data
+    assert first_day_sets(client) == [3, 3]
+    assert client.get("/api/plan").json["version"] == plan["version"] + 1
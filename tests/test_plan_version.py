@@ -0,0 +1,39 @@
+import pytest
+from flask_login import login_user
+
+from server import Mesocycles, Users, WorkoutPlan, app, db
+
+
+def plan_version():
+    return db.session.get(Users, 1).plan_version
+
+
+@pytest.mark.parametrize("flush", [False, True])
+def test_plan_write_bumps_version_even_after_flush(client, flush):
+    with app.test_request_context():
+        login_user(db.session.get(Users, 1))
+        before = plan_version()
+
+        mesocycle = Mesocycles(1, 4, 1, "Next mesocycle")
+        db.session.add(mesocycle)
+        db.session.flush()
+        db.session.add(WorkoutPlan(1, "Day 1", mesocycle.mesocycle_id))
+        if flush:
+            db.session.flush()
+        db.session.commit()
+
+        db.session.expire_all()
+        assert plan_version() == before + 1
+
+
+def test_other_writes_keep_version(client):
+    with app.test_request_context():
+        login_user(db.session.get(Users, 1))
+        before = plan_version()
+
+        db.session.get(Users, 1).weight = 81
+        db.session.flush()
+        db.session.commit()
+
+        db.session.expire_all()
+        assert plan_version() == before
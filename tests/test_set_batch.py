@@ -0,0 +1,24 @@
+from server import Sessions, app, db
+
+
+def test_batch_rejects_only_invalid_sets(client):
+    client.post("/login", data={"username": "test", "password": "test"})
+    with app.app_context():
+        session = Sessions(1, 1, "")
+        db.session.add(session)
+        db.session.commit()
+        session_id = session.session_id
+
+    response = client.post(f"/api/sessions/{session_id}/sets/batch", json={"sets": [
+        {"key": "k1", "exercise": "Barbell Bench Press", "weight": 100, "reps": 8},
+        {"key": "k2", "exercise": "Barbell Bench Press", "weight": 100, "reps": "eight"},
+        {"key": "k3", "exercise": "No Such Exercise", "weight": 100, "reps": 8},
+        {"key": "k4", "exercise": "Barbell Row", "weight": 80, "reps": 10},
+    ]})
+
+    assert response.status_code == 200
+    assert [item["exercise"] for item in response.json["sets"]] == ["Barbell Bench Press", "Barbell Row"]
+    assert [(item["key"], item["error"]) for item in response.json["rejected"]] == [
+        ("k2", "'reps' must be int"),
+        ("k3", "unknown exercise"),
+    ]
@@ -0,0 +1,36 @@
+import server
+from server import ExerciseEntries, app, db
+
+
+def todays_sets(exercise):
+    with app.app_context():
+        exercise_id = server.find_exercise_id_db(exercise)[0]
+        return (
+            db.session.query(ExerciseEntries)
+            .filter(ExerciseEntries.exercise_id == exercise_id, ExerciseEntries.notes == "today")
+            .order_by(ExerciseEntries.entry_id)
+            .all()
+        )
+
+
+def test_form_keeps_fractional_rpe(client):
+    client.post("/login", data={"username": "test", "password": "test"})
+    client.get("/training_session?training_day=Day 1")
+    client.get("/training_session?chosen_exercise=Barbell Bench Press")
+    client.post("/training_session", data={
+        "confirm_button": "1", "reps": "8", "kg": "100", "rpe": "8.5", "notes": "today",
+    })
+
+    assert [entry.rpe for entry in todays_sets("Barbell Bench Press")] == [8.5]
+
+
+def test_form_rejects_what_api_rejects(client):
+    client.post("/login", data={"username": "test", "password": "test"})
+    client.get("/training_session?training_day=Day 1")
+    client.get("/training_session?chosen_exercise=Barbell Bench Press")
+    response = client.post("/training_session", data={
+        "confirm_button": "1", "reps": "8.5", "kg": "100", "rpe": "8", "notes": "today",
+    }, follow_redirects=True)
+
+    assert todays_sets("Barbell Bench Press") == []
+    assert b"Set was not saved: &#39;reps&#39; must be int" in response.data
@@ -0,0 +1,55 @@
+import pytest
+
+import server
+from conftest import count_statements
+
+# Statements one refresh of training_session may run: load_user, plan (cold plan cache)
+# and load_training_session_view
+TRAINING_SESSION_STATEMENT_BUDGET = 3
+
+PAGES = {
+    "day chosen": "/training_session?chosen_exercise=",
+    "exercise chosen": "/training_session?chosen_exercise=Barbell Bench Press",
+    "after set saved": "/training_session",
+}
+
+
+@pytest.fixture()
+def logged_in(client):
+    client.post("/login", data={"username": "test", "password": "test"})
+    client.get("/training_session?training_day=Day 1")
+    return client
+
+
+@pytest.mark.parametrize("page", PAGES)
+def test_training_session_statement_budget(logged_in, page):
+    if page == "after set saved":
+        logged_in.get("/training_session?chosen_exercise=Barbell Bench Press")
+        logged_in.post("/training_session", data={"confirm_button": "1", "reps": "8", "kg": "100", "rpe": "8"})
+
+    with server.plan_cache_lock:
+        server.plan_cache.clear()
+    with count_statements() as cold:
+        response = logged_in.get(PAGES[page])
+    with count_statements() as warm:
+        logged_in.get(PAGES[page])
+
+    assert response.status_code == 200
+    assert cold["statements"] <= TRAINING_SESSION_STATEMENT_BUDGET
+    assert warm["statements"] <= TRAINING_SESSION_STATEMENT_BUDGET
+
+
+
+# Day 1 sessions of conftest (Barbell Row, before it Barbell Bench Press) become previous
+# ones once today's session starts
+@pytest.mark.parametrize("previous, older", [(1, True), (2, False), (3, False), (50, False)])
+def test_previous_sessions_stop_at_oldest(logged_in, previous, older):
+    with server.app.app_context():
+        server.db.session.add(server.Sessions(1, 1, ""))
+        server.db.session.commit()
+    logged_in.get("/training_session?chosen_exercise=Barbell Bench Press")
+
+    response = logged_in.get(f"/training_session?previous={previous}")
+
+    assert response.status_code == 200
+    assert (b">Older</a>" in response.data) is older
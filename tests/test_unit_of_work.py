@@ -0,0 +1,43 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import server
+from server import ExerciseEntries, app, db
+
+NEW_SET = {"confirm_button": "1", "reps": "8", "kg": "100", "rpe": "8", "notes": "today"}
+
+
+@pytest.fixture()
+def logged_in(client):
+    client.post("/login", data={"username": "test", "password": "test"})
+    client.get("/training_session?training_day=Day 1")
+    client.get("/training_session?chosen_exercise=Barbell Bench Press")
+    return client
+
+
+def saved_today():
+    with app.app_context():
+        return db.session.query(ExerciseEntries).filter(ExerciseEntries.notes == "today").count()
+
+
+def test_database_error_is_reported_not_swallowed(logged_in, monkeypatch):
+    def failing_modify_set(submitted_data):
+        raise OperationalError("UPDATE exercise_entries", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(server, "modify_set", failing_modify_set)
+    response = logged_in.post("/training_session", data=NEW_SET)
+
+    assert response.status_code == 500
+    assert b"Nothing was saved - database error, please try again." in response.data
+    assert saved_today() == 0
+
+
+def test_other_errors_are_raised_after_rollback(logged_in, monkeypatch):
+    def failing_modify_set(submitted_data):
+        raise KeyError("update_reps")
+
+    monkeypatch.setattr(server, "modify_set", failing_modify_set)
+    with pytest.raises(KeyError):
+        logged_in.post("/training_session", data=NEW_SET)
+
+    assert saved_today() == 0